@@ -0,0 +1,269 @@
+#!/usr/bin/env pybricks-micropython
+
+#  This file is part of hugbug ev3 repository. See <https://github.com/hugbug/ev3>.
+#
+#  Micro-benchmark comparing the float control math of rov3r+ and gidd3 programs
+#  (motor power with power bump and compensation, steering angle, comfort compensation ramp,
+#  gidd3 motor mixing) with the fixed-point integer math used by the programs now.
+#  The fixed-point functions are loaded from rov3r+ and gidd3 programs and the mixer
+#  from common/motor_control.py.
+#  Measures time and memory allocations per gamepad event and the largest difference
+#  of the motor commands of both variants (the mixer rounds the turn before scaling
+#  the powers down, which adds up to about 1.5% at full throttle).
+#  Runs on the EV3 brick (MicroPython) and on desktop Python.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import gc
+import sys
+import time
+from program_functions import load_functions
+
+sys.path.append(__file__[:__file__.rfind("/") + 1] + "../common")
+from motor_control import Mixer, fixed_shift, fixed_one
+
+stick_deadzone = 5  # deadzone 5%
+
+# Number of events processed per measurement.
+iterations = 5000
+
+# Xbox gamepad ranges
+stick_max = 65535
+trigger_min = 0
+trigger_range = 1024
+
+max_steering_angle = 270
+comfort_factor_up = 0.8
+comfort_duration_up = 0.6
+
+def ticks_us():
+    """
+    Returns microseconds counter, uses "ticks_us" on MicroPython.
+    """
+    if hasattr(time, "ticks_us"):
+        return time.ticks_us()
+    return int(time.perf_counter() * 1000000)
+
+def mem_alloc():
+    """
+    Returns number of bytes allocated on the heap (MicroPython only, None on desktop Python).
+    """
+    if hasattr(gc, "mem_alloc"):
+        return gc.mem_alloc()
+    return None
+
+# Float variants, copied from rov3r+.py and gidd3.py before the switch to fixed-point math.
+
+def transform_stick_float(value, minimum, maximum, flat):
+    half = int((maximum - minimum + 1) / 2)
+    deadzone = max(int((maximum - minimum + 1) / 100 * stick_deadzone), flat)
+    value -= minimum + half
+    if abs(value) <= deadzone:
+        value = 0
+    elif value > 0:
+        value = (value - deadzone - 1) / (half - deadzone) * 100
+    else:
+        value = (value + deadzone) / (half - deadzone) * 100
+    return value
+
+def event_float(stick_x, stick_y, trigger, duration):
+    """
+    Processes one event with float math, returns the motor commands:
+    (rov3r+ power, rov3r+ steering angle, comfort compensation, gidd3 left motor, gidd3 right motor).
+    """
+    power_bump = (trigger - trigger_min) / trigger_range
+    if duration < comfort_duration_up:
+        compensation = comfort_factor_up + (1.0 - comfort_factor_up) * duration / comfort_duration_up
+    else:
+        compensation = 1.0
+    power = stick_y * (1 + power_bump) * compensation
+    angle = - stick_x * max_steering_angle / 100
+    right_trigger = (trigger - trigger_min) / trigger_range
+    left = stick_y - stick_x * (1 - right_trigger / 1.1)
+    right = stick_y + stick_x * (1 - right_trigger / 1.1)
+    # The mixer scales both powers down proportionally if one of them exceeds 100%
+    peak = max(abs(left), abs(right))
+    if peak > 100:
+        left = left * 100 / peak
+        right = right * 100 / peak
+    return (power, angle, compensation, left, right)
+
+# Fixed-point variants: functions of rov3r+.py and gidd3.py. The namespace provides
+# the settings and stand-ins for the functions and objects the measured functions use.
+
+class Clock:
+    """
+    Stand-in for module "utime", the time is set by the benchmark.
+    """
+    def __init__(self):
+        self.now = 0
+
+    def ticks_ms(self):
+        return self.now
+
+    def ticks_diff(self, end, start):
+        return end - start
+
+class Motor:
+    """
+    Motor stand-in remembering the last command.
+    """
+    def __init__(self):
+        self.power = 0
+        self.target = 0
+
+    def dc(self, duty, event_time=0):
+        self.power = duty
+
+    def track_target(self, angle, event_time=0):
+        self.target = angle
+
+def collect_axis(axis, value):
+    # Only the power bump is collected by the measured handler "on_bump"
+    program["power_bump"] = value
+
+def drive(_power_pos, _power_bump, _power_compensation):
+    program["power_compensation"] = _power_compensation
+
+clock = Clock()
+steering_motor = Motor()
+left_motor = Motor()
+right_motor = Motor()
+mixer = Mixer(left_motor, right_motor, 100, 100, 0)
+
+program = {
+    "fixed_shift": fixed_shift,
+    "fixed_one": fixed_one,
+    "utime": clock,
+    "trigger_min": trigger_min,
+    "trigger_range": trigger_range,
+    "max_steering_angle": max_steering_angle,
+    "comfort_factor": int(comfort_factor_up * fixed_one),
+    "comfort_duration": int(comfort_duration_up * 1000),
+    "comfort_time": None,
+    "frame_event_time": 0,
+    "steering_motor": steering_motor,
+    "steering_pos": 0,
+    "steering_sensitivity": fixed_one,
+    "power_pos": 0,
+    "power_bump": 0,
+    "power_compensation": fixed_one,
+    "axis_bump": 2,
+    "collect_axis": collect_axis,
+    "drive": drive,
+    "stick_deadzone": stick_deadzone,
+}
+load_functions("rov3r+/rov3r+.py", ("transform_stick", "propulsion_power", "steer",
+    "comfort_compensation_control", "on_bump"), program)
+load_functions("gidd3/gidd3.py", ("on_sensitivity",), program)
+transform_stick_fixed = program["transform_stick"]
+propulsion_power = program["propulsion_power"]
+steer = program["steer"]
+comfort_compensation_control = program["comfort_compensation_control"]
+on_bump = program["on_bump"]
+on_sensitivity = program["on_sensitivity"]
+
+def event_fixed(stick_x, stick_y, trigger, duration_ms):
+    """
+    Processes one event with fixed-point math, returns the same motor commands as "event_float"
+    (the compensation as fixed-point number).
+    """
+    # Geared up "duration_ms" milliseconds ago
+    clock.now = duration_ms
+    program["comfort_time"] = 0
+    program["power_compensation"] = program["comfort_factor"]
+    comfort_compensation_control()
+    on_bump(trigger)
+    program["power_pos"] = stick_y
+    power = propulsion_power()
+    steer(stick_x)
+    on_sensitivity(trigger)
+    mixer.mix(stick_y, stick_x, program["steering_sensitivity"])
+    return (power, steering_motor.target, program["power_compensation"],
+        left_motor.power, right_motor.power)
+
+def make_events():
+    """
+    Returns lists of stick x, stick y (-100..100), trigger (raw) and time since
+    gearing up (seconds and milliseconds) for the events.
+    """
+    xs = [((i * 37) % 201) - 100 for i in range(iterations)]
+    ys = [((i * 53) % 201) - 100 for i in range(iterations)]
+    triggers = [(i * 29) % trigger_range for i in range(iterations)]
+    durations_ms = [(i * 7) % 800 for i in range(iterations)]
+    durations = [ms / 1000 for ms in durations_ms]
+    return (xs, ys, triggers, durations, durations_ms)
+
+def measure(name, function, xs, ys, triggers, durations):
+    """
+    Runs the function for all events, prints time and allocations per event
+    and the number of garbage collections.
+    """
+    # Allocations with the garbage collector disabled
+    gc.collect()
+    gc.disable()
+    before = mem_alloc()
+    start = ticks_us()
+    for i in range(iterations):
+        function(xs[i], ys[i], triggers[i], durations[i])
+    elapsed = ticks_us() - start
+    after = mem_alloc()
+    gc.enable()
+
+    # Garbage collections with the collector enabled: the allocated memory drops after a collection
+    gc.collect()
+    collections = 0
+    if before is not None:
+        last = mem_alloc()
+        for i in range(iterations):
+            function(xs[i], ys[i], triggers[i], durations[i])
+            current = mem_alloc()
+            if current < last:
+                collections += 1
+            last = current
+
+    allocated = "n/a" if before is None else "%.1f bytes" % ((after - before) / iterations)
+    print("  %s: %.2f us per event, allocated %s per event, %s GC runs per %d events" %
+        (name, elapsed / iterations, allocated, collections if before is not None else "n/a", iterations))
+
+def check(xs, ys, triggers, durations, durations_ms):
+    """
+    Prints the largest differences of the motor commands between both variants (in percent of full scale).
+    """
+    deviation = [0, 0, 0, 0, 0]
+    for i in range(iterations):
+        float_result = event_float(xs[i], ys[i], triggers[i], durations[i])
+        fixed_result = event_fixed(xs[i], ys[i], triggers[i], durations_ms[i])
+        differences = (abs(float_result[0] - fixed_result[0]),
+            abs(float_result[1] - fixed_result[1]) * 100 / max_steering_angle,
+            abs(float_result[2] - fixed_result[2] / fixed_one) * 100,
+            abs(float_result[3] - fixed_result[3]),
+            abs(float_result[4] - fixed_result[4]))
+        for field in range(len(deviation)):
+            if differences[field] > deviation[field]:
+                deviation[field] = differences[field]
+    stick = 0
+    for value in range(0, stick_max + 1, 7):
+        difference = abs(round(transform_stick_float(value, 0, stick_max, 0)) -
+            transform_stick_fixed(value, 0, stick_max, 0))
+        if difference > stick:
+            stick = difference
+    print("Max difference (%% of full scale): power %.2f, steering %.2f, compensation %.2f, "
+        "gidd3 motors %.2f / %.2f, stick table %d" % tuple(deviation + [stick]))
+
+(xs, ys, triggers, durations, durations_ms) = make_events()
+print("Control math per gamepad event:")
+measure("float", event_float, xs, ys, triggers, durations)
+measure("fixed", event_fixed, xs, ys, triggers, durations_ms)
+check(xs, ys, triggers, durations, durations_ms)
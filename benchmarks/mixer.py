@@ -0,0 +1,109 @@
+#!/usr/bin/env pybricks-micropython
+
+#  This file is part of hugbug ev3 repository. See <https://github.com/hugbug/ev3>.
+#
+#  Micro-benchmark of the differential drive mixer of gidd3 and xbox-tank programs
+#  (class "Mixer" of common/motor_control.py) vs. the inline mixing used before, which left the motors
+#  to clip powers beyond 100%. Measures time and memory allocations per call and shows
+#  how the mixer keeps the turning at full throttle.
+#  Runs on the EV3 brick (MicroPython) and on desktop Python.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import gc
+import sys
+import time
+
+sys.path.append(__file__[:__file__.rfind("/") + 1] + "../common")
+from motor_control import Mixer, fixed_shift, fixed_one
+
+# Number of calls per measurement.
+iterations = 5000
+
+def ticks_us():
+    """
+    Returns microseconds counter, uses "ticks_us" on MicroPython.
+    """
+    if hasattr(time, "ticks_us"):
+        return time.ticks_us()
+    return int(time.perf_counter() * 1000000)
+
+def mem_alloc():
+    """
+    Returns number of bytes allocated on the heap (MicroPython only, None on desktop Python).
+    """
+    if hasattr(gc, "mem_alloc"):
+        return gc.mem_alloc()
+    return None
+
+class Motor:
+    """
+    Motor stand-in clipping the power like the motor does.
+    """
+    def __init__(self):
+        self.power = 0
+
+    def dc(self, duty):
+        self.power = min(max(duty, -100), 100)
+
+left_motor = Motor()
+right_motor = Motor()
+
+# Mixer with the settings of gidd3.py and tank.py.
+mixer = Mixer(left_motor, right_motor, 100, 100, 0)
+
+# Inline mixing used before.
+
+def mix_inline(forward, turn, sensitivity):
+    turn = (turn * sensitivity + (fixed_one >> 1)) >> fixed_shift
+    left_motor.dc(forward - turn)
+    right_motor.dc(forward + turn)
+
+def measure(name, function, forwards, turns):
+    """
+    Calls the function for all inputs, prints time and allocations per call.
+    """
+    gc.collect()
+    gc.disable()
+    before = mem_alloc()
+    start = ticks_us()
+    for i in range(iterations):
+        function(forwards[i], turns[i], fixed_one)
+    elapsed = ticks_us() - start
+    after = mem_alloc()
+    gc.enable()
+    allocated = "n/a" if before is None else "%.1f bytes" % ((after - before) / iterations)
+    print("  %s: %.2f us per call, allocated %s per call" % (name, elapsed / iterations, allocated))
+
+def show(forward, turn):
+    """
+    Prints motor powers of both variants for one stick position.
+    """
+    mix_inline(forward, turn, fixed_one)
+    inline = (left_motor.power, right_motor.power)
+    mixer.mix(forward, turn, fixed_one)
+    print("  forward %4d, turn %4d: inline %4d / %4d, mixer %4d / %4d" %
+        (forward, turn, inline[0], inline[1], left_motor.power, right_motor.power))
+
+forwards = [((i * 53) % 201) - 100 for i in range(iterations)]
+turns = [((i * 37) % 201) - 100 for i in range(iterations)]
+print("Differential drive mixer:")
+measure("inline", mix_inline, forwards, turns)
+measure("mixer", mixer.mix, forwards, turns)
+print("Motor powers (left / right):")
+show(100, 0)
+show(100, 30)
+show(100, 60)
+show(100, 100)
+show(-80, -50)
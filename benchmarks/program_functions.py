@@ -0,0 +1,49 @@
+#  This file is part of hugbug ev3 repository. See <https://github.com/hugbug/ev3>.
+#
+#  Loads functions from the programs of this repository, so the benchmarks measure
+#  the code of the programs instead of copies. Runs on the EV3 brick (MicroPython has
+#  no module "ast", the functions are found by their text) and on desktop Python.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Directory of the repository (parent of the directory of the benchmarks)
+repository_path = __file__[:__file__.rfind("/") + 1] + "../"
+
+def load_functions(program, names, namespace):
+    """
+    Loads top-level functions "names" from the program file (path relative to the repository)
+    into the namespace (dict), which serves as global variables of the functions and must
+    contain everything the functions use. Returns the namespace.
+    """
+    blocks = []
+    found = []
+    block = None
+    with open(repository_path + program) as program_file:
+        for line in program_file:
+            if line[:1] not in ("", " ", "\t", "\n", "\r"):
+                block = None
+                if line.startswith("def "):
+                    name = line[4:line.find("(")].strip()
+                    if name in names:
+                        block = []
+                        blocks.append(block)
+                        found.append(name)
+            if block is not None:
+                block.append(line)
+    for name in names:
+        if name not in found:
+            raise ValueError("Function " + name + " not found in " + program)
+    for block in blocks:
+        exec("".join(block), namespace)
+    return namespace
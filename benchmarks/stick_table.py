@@ -0,0 +1,78 @@
+#!/usr/bin/env pybricks-micropython
+
+#  This file is part of hugbug ev3 repository. See <https://github.com/hugbug/ev3>.
+#
+#  Micro-benchmark comparing function "transform_stick" with the lookup table
+#  built by function "build_stick_table", both loaded from rov3r+ program.
+#  Runs on the EV3 brick (MicroPython) and on desktop Python.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+from array import array
+from program_functions import load_functions
+
+stick_deadzone = 5  # deadzone 5%
+
+# Number of stick values transformed per measurement.
+iterations = 20000
+
+def ticks_us():
+    """
+    Returns microseconds counter, uses "ticks_us" on MicroPython.
+    """
+    if hasattr(time, "ticks_us"):
+        return time.ticks_us()
+    return int(time.perf_counter() * 1000000)
+
+# Functions "transform_stick" and "build_stick_table" of rov3r+.py.
+rov3r = load_functions("rov3r+/rov3r+.py", ("transform_stick", "build_stick_table"),
+    {"array": array, "stick_deadzone": stick_deadzone})
+transform_stick = rov3r["transform_stick"]
+build_stick_table = rov3r["build_stick_table"]
+
+def benchmark(name, max):
+    """
+    Measures both variants for a stick with range 0..max and prints the results.
+    """
+    start = ticks_us()
+    (table, shift) = build_stick_table((0, max, 0, 0))
+    build_time = ticks_us() - start
+
+    step = max // 255 + 1
+    values = [(i * step) % (max + 1) for i in range(iterations)]
+
+    start = ticks_us()
+    for value in values:
+        result = transform_stick(value, 0, max, 0)
+    function_time = ticks_us() - start
+
+    start = ticks_us()
+    for value in values:
+        result = table[value >> shift]
+    table_time = ticks_us() - start
+
+    deviation = 0
+    for value in range(max + 1):
+        difference = abs(table[value >> shift] - transform_stick(value, 0, max, 0))
+        if difference > deviation:
+            deviation = difference
+
+    print("%s (0..%d): table %d entries built in %d us, max deviation %.2f" %
+        (name, max, len(table), build_time, deviation))
+    print("  transform_stick: %.2f us per value" % (function_time / iterations))
+    print("  table lookup:    %.2f us per value" % (table_time / iterations))
+
+benchmark("PS", 255)
+benchmark("Xbox", 65535)
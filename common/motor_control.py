@@ -0,0 +1,158 @@
+#  This file is part of hugbug ev3 repository. See <https://github.com/hugbug/ev3>.
+#
+#  Motor control shared by the programs of this repository: motor command cache
+#  (rov3r+, gidd3, xbox-tank, xbox-tractor) and differential drive mixer (gidd3, xbox-tank).
+#  Runs on the EV3 brick (LEGO MicroPython) and on desktop Python with the simulator "ev3-sim".
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import utime
+from array import array
+
+# A proxy for motors skipping commands which don't change anything,
+# each command sent to a motor is a write to a file of the motor driver.
+class CachedMotor:
+    """
+    Motor proxy remembering the last command sent to the motor.
+    Each command is a write to the motor driver, commands which don't change the value
+    of the last command by more than "epsilon" are suppressed. Commands with value 0
+    and stop commands always go through unless they repeat the last command exactly,
+    so the motor is always stopped.
+    If "interval" is given, commands are sent at most once per "interval" milliseconds,
+    a command coming too early is kept as pending and sent by "flush". Commands with
+    value 0 and stop commands are never delayed.
+    A command can carry the timestamp (seconds, see "time.time") of the input it applies,
+    "on_write" is called with the timestamp when the command is written to the motor.
+    Other motor methods are passed to the motor and make the proxy forget the last command.
+    """
+    def __init__(self, motor, epsilon, interval=0, on_write=None):
+        self.motor = motor
+        self.epsilon = epsilon
+        self.interval = interval
+        self.on_write = on_write
+        self.command = None # last command sent: "dc", "track_target" or "stop"
+        self.value = 0 # value of the last command
+        self.time = 0 # time of the last command in milliseconds
+        self.pending = None # command waiting for the end of the interval
+        self.pending_value = 0
+        self.pending_event_time = 0 # timestamp of the input of the pending command
+        self.issued = 0 # number of commands sent to the motor
+        self.suppressed = 0 # number of redundant commands not sent
+
+    def dc(self, duty, event_time=0):
+        self.send("dc", duty, event_time)
+
+    def track_target(self, angle, event_time=0):
+        self.send("track_target", angle, event_time)
+
+    def stop(self, stop_type, event_time=0):
+        self.send("stop", stop_type, event_time)
+
+    def speed(self):
+        return self.motor.speed()
+
+    def angle(self):
+        return self.motor.angle()
+
+    def __getattr__(self, name):
+        self.command = None
+        self.pending = None
+        return getattr(self.motor, name)
+
+    def send(self, command, value, event_time):
+        stopping = command == "stop" or value == 0
+        if command == self.command and (value == self.value or
+                not stopping and abs(value - self.value) <= self.epsilon):
+            self.suppressed += 1
+            self.pending = None
+            return
+        if self.interval > 0:
+            now = utime.ticks_ms()
+            if not stopping and utime.ticks_diff(now, self.time) < self.interval:
+                if self.pending is not None:
+                    self.suppressed += 1
+                self.pending = command
+                self.pending_value = value
+                self.pending_event_time = event_time
+                return
+            self.time = now
+        self.pending = None
+        self.command = command
+        self.value = value
+        self.issued += 1
+        if command == "dc":
+            self.motor.dc(value)
+        elif command == "track_target":
+            self.motor.track_target(value)
+        else:
+            self.motor.stop(value)
+        if event_time and self.on_write is not None:
+            self.on_write(event_time)
+
+    def flush(self):
+        """
+        Sends the pending command once the interval since the last command has passed.
+        """
+        if (self.pending is not None and
+                utime.ticks_diff(utime.ticks_ms(), self.time) >= self.interval):
+            self.send(self.pending, self.pending_value, self.pending_event_time)
+
+# Steering sensitivity of the mixer is a fixed-point integer with "fixed_shift" fractional bits,
+# "fixed_one" stands for 1.0. On MicroPython each float result is a new object on the heap,
+# integer math doesn't allocate memory.
+fixed_shift = 10
+fixed_one = 1 << fixed_shift
+
+def build_motor_table(trim, curve):
+    """
+    Builds lookup table for the power of a motor (index is the power -100..100 plus 100)
+    applying the trim (percent of the power) and the response curve (0..100).
+    """
+    table = array('b', bytes(201))
+    for index in range(len(table)):
+        power = index - 100
+        power = power * trim / 100 * (100 - curve + curve * power * power / 10000) / 100
+        table[index] = min(max(round(power), -100), 100)
+    return table
+
+class Mixer:
+    """
+    Differential drive mixer: the powers of the left and right motor are forward - turn
+    and forward + turn. If one of them exceeds 100%, both are scaled down proportionally
+    instead of being clipped by the motor, so the vehicle keeps turning at full throttle.
+    The powers then go through lookup tables of the motors applying the trim (percent
+    of the power of the motor, lower it for the faster motor if the vehicle pulls to one side)
+    and the response curve (0 is linear, up to 100 gives finer control at low powers).
+    The tables are built at start, so mixing uses integer math only.
+    """
+    def __init__(self, left_motor, right_motor, left_trim=100, right_trim=100, curve=0):
+        self.left_motor = left_motor
+        self.right_motor = right_motor
+        self.left_table = build_motor_table(left_trim, curve)
+        self.right_table = build_motor_table(right_trim, curve)
+
+    def mix(self, forward, turn, sensitivity=fixed_one):
+        """
+        Sets the powers of the motors from forward and turn (-100..100). The turn is scaled
+        by the sensitivity (fixed-point, "fixed_one" is full sensitivity).
+        """
+        turn = (turn * sensitivity + (fixed_one >> 1)) >> fixed_shift
+        left = forward - turn
+        right = forward + turn
+        peak = max(abs(left), abs(right))
+        if peak > 100:
+            left = (left * 200 + peak) // (2 * peak)
+            right = (right * 200 + peak) // (2 * peak)
+        self.left_motor.dc(self.left_table[left + 100])
+        self.right_motor.dc(self.right_table[right + 100])
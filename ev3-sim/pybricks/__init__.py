@@ -0,0 +1,23 @@
+#  This file is part of hugbug ev3 repository. See <https://github.com/hugbug/ev3>.
+#
+#  Desktop stand-in for the pybricks modules of LEGO MicroPython for EV3.
+#  Put directory "ev3-sim" on the module search path to run the programs
+#  on plain Linux, see README.md.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+# Print display texts and sounds to the console if environment variable EV3_SIM_VERBOSE is set.
+verbose = bool(os.environ.get("EV3_SIM_VERBOSE"))
@@ -0,0 +1,66 @@
+#  This file is part of hugbug ev3 repository. See <https://github.com/hugbug/ev3>.
+#
+#  Desktop stand-in for module "pybricks.ev3brick": display and sound do nothing
+#  (or print to the console if environment variable EV3_SIM_VERBOSE is set),
+#  no buttons are pressed.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from pybricks import verbose
+
+class _Display:
+    def clear(self):
+        if verbose:
+            print("[display] clear")
+
+    def text(self, text, coordinate=None):
+        if verbose:
+            print("[display]", coordinate, text)
+
+    def image(self, file_name, alignment=None, coordinate=None, clear=True):
+        if verbose:
+            print("[display] image", file_name)
+
+class _Sound:
+    def beep(self, frequency=500, duration=100, volume=30):
+        if verbose:
+            print("[sound] beep", frequency, duration)
+
+    def beeps(self, number):
+        if verbose:
+            print("[sound] beeps", number)
+
+    def file(self, file_name, volume=100):
+        if verbose:
+            print("[sound] file", file_name)
+
+class _Battery:
+    def voltage(self):
+        return 8000
+
+    def current(self):
+        return 200
+
+display = _Display()
+sound = _Sound()
+battery = _Battery()
+
+def buttons():
+    """
+    Returns the list of pressed buttons, always empty.
+    """
+    return []
+
+def light(color):
+    pass
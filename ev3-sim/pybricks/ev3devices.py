@@ -0,0 +1,143 @@
+#  This file is part of hugbug ev3 repository. See <https://github.com/hugbug/ev3>.
+#
+#  Desktop stand-in for module "pybricks.ev3devices".
+#  The motor is simulated with simple inertia and end stops, where it stalls.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+
+from pybricks.parameters import Stop
+
+# Speed of the motor (deg/s) at 100% duty cycle.
+max_speed = 1000
+
+# Time constant (seconds) of the motor speed following the duty cycle (inertia).
+time_constant = 0.1
+
+# Gain (1/s) of the speed controller when tracking a target angle.
+tracking_gain = 10
+
+# End stops (minimum and maximum angle) of the mechanism driven by the motor, per port.
+# Set with environment variable EV3_SIM_END_STOPS, for example "B=-330:330,C=-400:20".
+# Motors without end stops stall in "run_until_stalled" after "free_stall_angle" degrees.
+end_stops = {}
+free_stall_angle = 360
+
+for item in os.environ.get("EV3_SIM_END_STOPS", "").split(","):
+    if "=" in item:
+        (port, limits) = item.split("=")
+        (minimum, maximum) = limits.split(":")
+        end_stops[port.strip()] = (float(minimum), float(maximum))
+
+class Motor:
+    """
+    Simulated EV3 motor. The direction parameter is accepted but has no effect.
+    Commands which wait for the motor to finish complete immediately.
+    """
+
+    def __init__(self, port, direction=None, gears=None):
+        self._port = port
+        self._position = 0.0 # physical position (degrees)
+        self._zero = 0.0 # physical position of angle 0
+        self._speed = 0.0
+        self._duty = 0.0
+        self._run_speed = None # speed of "run", None if not running at constant speed
+        self._target = None # target angle of "track_target", None if not tracking
+        self._end_stops = end_stops.get(port)
+        self._time = time.monotonic()
+
+    def _update(self):
+        now = time.monotonic()
+        dt = now - self._time
+        self._time = now
+        if self._target is not None:
+            wanted = tracking_gain * (self._zero + self._target - self._position)
+            wanted = max(-max_speed, min(max_speed, wanted))
+        elif self._run_speed is not None:
+            wanted = self._run_speed
+        else:
+            wanted = self._duty / 100 * max_speed
+        self._speed += (wanted - self._speed) * min(1.0, dt / time_constant)
+        self._position += self._speed * dt
+        if self._end_stops is not None:
+            if self._position <= self._end_stops[0] and self._speed < 0:
+                self._position = self._end_stops[0]
+                self._speed = 0.0
+            elif self._position >= self._end_stops[1] and self._speed > 0:
+                self._position = self._end_stops[1]
+                self._speed = 0.0
+
+    def _move_to(self, position):
+        # Moves immediately to the position, limited by the end stops
+        if self._end_stops is not None:
+            position = max(self._end_stops[0], min(self._end_stops[1], position))
+        self._position = position
+        self._speed = 0.0
+        self._duty = 0.0
+        self._run_speed = None
+        self._target = None
+        self._time = time.monotonic()
+
+    def dc(self, duty):
+        self._update()
+        self._duty = max(-100.0, min(100.0, float(duty)))
+        self._run_speed = None
+        self._target = None
+
+    def angle(self):
+        self._update()
+        return int(self._position - self._zero)
+
+    def speed(self):
+        self._update()
+        return int(self._speed)
+
+    def reset_angle(self, angle):
+        self._update()
+        self._zero = self._position - angle
+
+    def stop(self, stop_type=Stop.COAST):
+        self.dc(0)
+
+    def run(self, speed):
+        self._update()
+        self._run_speed = float(speed)
+        self._target = None
+
+    def run_time(self, speed, time, stop_type=Stop.COAST, wait=True):
+        self._update()
+        self._move_to(self._position + speed * time / 1000)
+
+    def run_angle(self, speed, rotation_angle, stop_type=Stop.COAST, wait=True):
+        self._update()
+        self._move_to(self._position + rotation_angle)
+
+    def run_target(self, speed, target_angle, stop_type=Stop.COAST, wait=True):
+        self._update()
+        self._move_to(self._zero + target_angle)
+
+    def run_until_stalled(self, speed, stop_type=Stop.COAST, duty_limit=None):
+        self._update()
+        if self._end_stops is not None:
+            self._move_to(self._end_stops[1] if speed > 0 else self._end_stops[0])
+        else:
+            self._move_to(self._position + (free_stall_angle if speed > 0 else -free_stall_angle))
+        return self.angle()
+
+    def track_target(self, target_angle):
+        self._update()
+        self._target = float(target_angle)
+        self._run_speed = None
@@ -0,0 +1,67 @@
+#  This file is part of hugbug ev3 repository. See <https://github.com/hugbug/ev3>.
+#
+#  Desktop stand-in for module "pybricks.parameters".
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+class Port:
+    A = "A"
+    B = "B"
+    C = "C"
+    D = "D"
+    S1 = "S1"
+    S2 = "S2"
+    S3 = "S3"
+    S4 = "S4"
+
+class Stop:
+    COAST = 0
+    BRAKE = 1
+    HOLD = 2
+
+class Direction:
+    CLOCKWISE = 0
+    COUNTERCLOCKWISE = 1
+
+class Button:
+    LEFT_DOWN = 1
+    DOWN = 2
+    RIGHT_DOWN = 3
+    LEFT = 4
+    CENTER = 5
+    RIGHT = 6
+    LEFT_UP = 7
+    UP = 8
+    BEACON = 8
+    RIGHT_UP = 9
+
+class Color:
+    BLACK = 1
+    BLUE = 2
+    GREEN = 3
+    YELLOW = 4
+    RED = 5
+    WHITE = 6
+    BROWN = 7
+    ORANGE = 8
+    PURPLE = 9
+
+class SoundFile:
+    AIR_RELEASE = "Air release"
+    AIRBRAKE = "Airbrake"
+    ERROR_ALARM = "Error alarm"
+    HORN_1 = "Horn 1"
+    HORN_2 = "Horn 2"
+    LASER = "Laser"
+    SONAR = "Sonar"
@@ -0,0 +1,51 @@
+#  This file is part of hugbug ev3 repository. See <https://github.com/hugbug/ev3>.
+#
+#  Desktop stand-in for module "pybricks.tools".
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import builtins
+import time
+
+print = builtins.print
+
+def wait(time_ms):
+    """
+    Pauses the program for the given time (in milliseconds).
+    """
+    time.sleep(time_ms / 1000)
+
+class StopWatch:
+    """
+    Stopwatch measuring time in milliseconds.
+    """
+    def __init__(self):
+        self._start = time.monotonic()
+        self._paused = None
+
+    def time(self):
+        end = self._paused if self._paused is not None else time.monotonic()
+        return int((end - self._start) * 1000)
+
+    def pause(self):
+        if self._paused is None:
+            self._paused = time.monotonic()
+
+    def resume(self):
+        if self._paused is not None:
+            self._start += time.monotonic() - self._paused
+            self._paused = None
+
+    def reset(self):
+        self._start = self._paused if self._paused is not None else time.monotonic()
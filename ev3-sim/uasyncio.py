@@ -0,0 +1,68 @@
+#  This file is part of hugbug ev3 repository. See <https://github.com/hugbug/ev3>.
+#
+#  Desktop stand-in for MicroPython module "uasyncio", the parts used by the programs
+#  on top of Python module "asyncio".
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+from asyncio import CancelledError, Event, create_task, gather, run, sleep
+
+async def sleep_ms(ms):
+    await asyncio.sleep(ms / 1000)
+
+class StreamReader:
+    """
+    Stream reading from any file with a file descriptor, like the stream of uasyncio
+    which works with every object supported by "uselect.poll".
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    async def readinto(self, buffer):
+        """
+        Waits until the file is readable and reads into the buffer.
+        Like the streams of MicroPython it reads until the buffer is full or the file ends,
+        so a blocking file stalls until enough data arrive. A non-blocking file returns
+        the pending data, None if there are none.
+        """
+        loop = asyncio.get_running_loop()
+        readable = loop.create_future()
+        fd = self._stream.fileno()
+        try:
+            loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+        except PermissionError:
+            # Regular files can't be watched, they're always readable
+            return self._read(buffer)
+        try:
+            await readable
+        finally:
+            loop.remove_reader(fd)
+        return self._read(buffer)
+
+    def _read(self, buffer):
+        view = memoryview(buffer)
+        done = 0
+        while done < len(view):
+            size = self._stream.readinto(view[done:])
+            if size is None:
+                return done or None
+            if size == 0:
+                break
+            done += size
+        return done
+
+    def close(self):
+        self._stream.close()
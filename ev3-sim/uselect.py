@@ -0,0 +1,51 @@
+#  This file is part of hugbug ev3 repository. See <https://github.com/hugbug/ev3>.
+#
+#  Desktop stand-in for MicroPython module "uselect".
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import select
+
+POLLIN = select.POLLIN
+POLLOUT = select.POLLOUT
+POLLERR = select.POLLERR
+POLLHUP = select.POLLHUP
+
+class _Poll:
+    """
+    Poll object returning registered objects (not file descriptors) like MicroPython does.
+    """
+    def __init__(self):
+        self._poll = select.poll()
+        self._objects = {}
+
+    def register(self, obj, eventmask=POLLIN | POLLOUT):
+        fd = obj if isinstance(obj, int) else obj.fileno()
+        self._objects[fd] = obj
+        self._poll.register(fd, eventmask)
+
+    def unregister(self, obj):
+        fd = obj if isinstance(obj, int) else obj.fileno()
+        self._poll.unregister(fd)
+        del self._objects[fd]
+
+    def modify(self, obj, eventmask):
+        fd = obj if isinstance(obj, int) else obj.fileno()
+        self._poll.modify(fd, eventmask)
+
+    def poll(self, timeout=-1):
+        return [(self._objects[fd], event) for (fd, event) in self._poll.poll(timeout)]
+
+def poll():
+    return _Poll()
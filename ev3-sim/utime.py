@@ -0,0 +1,43 @@
+#  This file is part of hugbug ev3 repository. See <https://github.com/hugbug/ev3>.
+#
+#  Desktop stand-in for MicroPython module "utime".
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time as _time
+
+# Tick counters wrap around like on MicroPython (30 bits).
+_TICKS_PERIOD = 1 << 30
+_TICKS_HALFPERIOD = _TICKS_PERIOD >> 1
+
+time = _time.time
+sleep = _time.sleep
+
+def sleep_ms(ms):
+    _time.sleep(ms / 1000)
+
+def sleep_us(us):
+    _time.sleep(us / 1000000)
+
+def ticks_ms():
+    return int(_time.monotonic() * 1000) & (_TICKS_PERIOD - 1)
+
+def ticks_us():
+    return int(_time.monotonic() * 1000000) & (_TICKS_PERIOD - 1)
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & (_TICKS_PERIOD - 1)
+
+def ticks_diff(ticks1, ticks2):
+    return ((ticks1 - ticks2 + _TICKS_HALFPERIOD) & (_TICKS_PERIOD - 1)) - _TICKS_HALFPERIOD
@@ -0,0 +1,160 @@
+#!/usr/bin/env pybricks-micropython
+
+#  This file is part of hugbug ev3 repository. See <https://github.com/hugbug/ev3>.
+#
+#  This is a program to record events of Xbox or PS controller to a file,
+#  which can be replayed later with program "replay.py".
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import struct
+import sys
+try:
+    import uselect
+except ImportError:
+    # Desktop Python
+    import select as uselect
+
+# Usage: record.py [output file] [device file]
+# By default the gamepad is detected automatically and the events are written to "gamepad.rec".
+# The recording stops when the program is interrupted or the gamepad disconnects.
+
+# Constants for gamepad type.
+gamepad_xbox = 1
+gamepad_ps = 2
+
+# Recording file consists of a header and the recorded events.
+# Header: magic "GPREC", format version, gamepad type, reserved byte.
+# Event: seconds and microseconds of the timestamp, event type, event code, value;
+# all little-endian, independent of the platform the recording was made on.
+record_magic = b"GPREC"
+record_version = 1
+record_header_format = '<5sBBB'
+record_event_format = '<IIHHi'
+
+# An events read from the virtual device file consists of the following elements:
+# long int, long int, unsigned short, unsigned short, int
+# (the value is a 32-bit int, the same as long int on the EV3 brick)
+gamepad_event_format = 'llHHi'
+gamepad_event_size = struct.calcsize(gamepad_event_format)
+gamepad_event_batch = 16
+gamepad_usec_offset = struct.calcsize('l')
+gamepad_type_offset = struct.calcsize('ll')
+gamepad_code_offset = gamepad_type_offset + 2
+gamepad_value_offset = gamepad_type_offset + 4
+
+def find_gamepad():
+    """
+    Checks device list by reading content of virtual file "/proc/bus/input/devices"
+    looking for gamepad device.
+    Returns tuple (device name, gamepad type) or None if no gamepad was found.
+    """
+    gamepad_type = 0
+    with open("/proc/bus/input/devices", "r") as fp:
+        line = fp.readline()
+        while line:
+            if line.startswith("N: Name=") and line.find("Xbox") > -1:
+                gamepad_type = gamepad_xbox
+            if line.startswith("N: Name=") and line.find("PLAYSTATION") > -1 and line.find("Motion") == -1:
+                gamepad_type = gamepad_ps
+            if gamepad_type > 0 and line.startswith("H: Handlers="):
+                line = line[len("H: Handlers="):]
+                pb = line.find("event")
+                pe = line.find(" ", pb)
+                return (line[pb:pe], gamepad_type)
+            line = fp.readline()
+    return None
+
+def decode_u16(buffer, pos):
+    """
+    Decodes unsigned short (little-endian) at the given position of the buffer.
+    """
+    return buffer[pos] | (buffer[pos + 1] << 8)
+
+def decode_s32(buffer, pos):
+    """
+    Decodes signed 32-bit integer (little-endian) at the given position of the buffer.
+    """
+    value = buffer[pos] | (buffer[pos + 1] << 8) | (buffer[pos + 2] << 16)
+    if buffer[pos + 3] & 0x80:
+        return value + ((buffer[pos + 3] - 256) << 24)
+    return value + (buffer[pos + 3] << 24)
+
+def set_nonblocking(device_file):
+    """
+    Switches the opened device file to non-blocking mode. On MicroPython a blocking read
+    waits until the whole buffer is filled, a non-blocking read returns the pending events
+    at once (None if there are none).
+    """
+    try:
+        import os
+        os.set_blocking(device_file.fileno(), False)
+    except (ImportError, AttributeError):
+        # MicroPython has no "os.set_blocking", call fcntl from the C library directly
+        import ffi
+        fcntl = ffi.open("libc.so.6").func("i", "fcntl", "iii")
+        flags = fcntl(device_file.fileno(), 3, 0) # F_GETFL
+        fcntl(device_file.fileno(), 4, flags | 0x800) # F_SETFL, O_NONBLOCK
+
+def record(device_path, gamepad_type, output_path):
+    """
+    Reads events from the device file and writes them to the recording file.
+    Returns the number of recorded events.
+    """
+    count = 0
+    event_buffer = bytearray(gamepad_event_size * gamepad_event_batch)
+    with open(device_path, "rb", buffering=0) as in_file, open(output_path, "wb") as out_file:
+        out_file.write(struct.pack(record_header_format, record_magic, record_version, gamepad_type, 0))
+        # Read the pending events as soon as they arrive, not when the buffer is full
+        set_nonblocking(in_file)
+        event_poll = uselect.poll()
+        event_poll.register(in_file, uselect.POLLIN)
+        try:
+            while True:
+                event_poll.poll()
+                size = in_file.readinto(event_buffer)
+                if size is None:
+                    # No events pending after all
+                    continue
+                if not size:
+                    break
+                for pos in range(0, size, gamepad_event_size):
+                    out_file.write(struct.pack(record_event_format,
+                        decode_s32(event_buffer, pos) & 0xFFFFFFFF,
+                        decode_s32(event_buffer, pos + gamepad_usec_offset),
+                        decode_u16(event_buffer, pos + gamepad_type_offset),
+                        decode_u16(event_buffer, pos + gamepad_code_offset),
+                        decode_s32(event_buffer, pos + gamepad_value_offset)))
+                    count += 1
+                out_file.flush()
+        except (KeyboardInterrupt, OSError):
+            # Stopped by user or gamepad disconnected
+            pass
+    return count
+
+output_path = sys.argv[1] if len(sys.argv) > 1 else "gamepad.rec"
+if len(sys.argv) > 2:
+    device_path = sys.argv[2]
+    gamepad_type = gamepad_xbox
+else:
+    gamepad = find_gamepad()
+    if gamepad is None:
+        print("Gamepad not found")
+        sys.exit(1)
+    device_path = "/dev/input/" + gamepad[0]
+    gamepad_type = gamepad[1]
+
+print("Recording", device_path, "to", output_path, "- press Ctrl+C to stop")
+count = record(device_path, gamepad_type, output_path)
+print("Recorded", count, "events")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+#  This file is part of hugbug ev3 repository. See <https://github.com/hugbug/ev3>.
+#
+#  This is a program to replay gamepad events recorded with program "record.py".
+#  The events are written in the format of the gamepad virtual device file,
+#  usually into a FIFO which is read by one of the programs instead of the gamepad.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import struct
+import sys
+import time
+
+# Usage: replay.py <recording file> <output file> [--fast]
+# Events are replayed with their original timing, or as fast as possible with "--fast".
+# The replayed events get the current time as timestamp.
+
+# Format of the recording file, see "record.py".
+record_magic = b"GPREC"
+record_header_format = '<5sBBB'
+record_header_size = struct.calcsize(record_header_format)
+record_event_format = '<IIHHi'
+record_event_size = struct.calcsize(record_event_format)
+
+# Format of events in the gamepad virtual device file, as read by the programs.
+gamepad_event_format = 'llHHi'
+
+gamepad_names = {1: "xbox", 2: "ps"}
+
+def replay(recording_path, output_path, fast):
+    """
+    Writes events from the recording file to the output file.
+    Events of one frame (up to SYN_REPORT) are written at once.
+    Returns the number of replayed events.
+    """
+    count = 0
+    with open(recording_path, "rb") as in_file:
+        (magic, version, gamepad_type, reserved) = struct.unpack(record_header_format,
+            in_file.read(record_header_size))
+        if magic != record_magic:
+            raise ValueError("Not a gamepad recording: " + recording_path)
+        print("Gamepad:", gamepad_names.get(gamepad_type, "unknown"))
+
+        with open(output_path, "wb") as out_file:
+            frame = bytearray()
+            start_time = time.time()
+            first_time = None
+            event = in_file.read(record_event_size)
+            while len(event) == record_event_size:
+                (tv_sec, tv_usec, ev_type, code, value) = struct.unpack(record_event_format, event)
+                event_time = tv_sec + tv_usec / 1000000
+                if first_time is None:
+                    first_time = event_time
+                if not fast and len(frame) == 0:
+                    delay = start_time + event_time - first_time - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                now = time.time()
+                frame += struct.pack(gamepad_event_format, int(now), int(now * 1000000) % 1000000,
+                    ev_type, code, value)
+                count += 1
+                if ev_type == 0 and code == 0:
+                    # SYN_REPORT, end of the event frame
+                    out_file.write(frame)
+                    out_file.flush()
+                    frame = bytearray()
+                event = in_file.read(record_event_size)
+            out_file.write(frame)
+    return count
+
+if len(sys.argv) < 3:
+    print("Usage: replay.py <recording file> <output file> [--fast]")
+    sys.exit(1)
+
+count = replay(sys.argv[1], sys.argv[2], "--fast" in sys.argv[3:])
+print("Replayed", count, "events")
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+
+#  This file is part of hugbug ev3 repository. See <https://github.com/hugbug/ev3>.
+#
+#  This is a program to tune the tables of the automatic gearbox of Rov3r+ offline.
+#  The shift rules of function "automatic_gearbox_control" are run over throttle traces
+#  (recorded with "gamepad-record/record.py" or synthetic) for thousands of candidate
+#  tables at once with NumPy, driving a simple model of the motor and the vehicle.
+#  Runs on a desktop computer, requires NumPy.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import ast
+import os
+import struct
+import sys
+from array import array
+import numpy as np
+
+# Usage: gearbox_tuner.py [recording file ...] [--comfort] [--candidates N] [--spread S] [--seed N]
+# Without recording files synthetic throttle traces are used.
+
+# Program with the gearbox tables and the shift rules.
+program_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rov3r+", "rov3r+.py")
+
+# Functions of the program run by the reference simulation (see "check_reference").
+program_functions = ("propulsion_power", "drive", "switch_gear", "reset_automatic_gearbox",
+    "automatic_gearbox_control", "comfort_compensation_control",
+    "transform_stick", "build_stick_table")
+
+# Rate (in Hz) of the gearbox control in the program.
+control_rate = 50
+dt = 1.0 / control_rate
+
+# Model of motor and vehicle, rough values to be fitted to the car.
+# The motor torque falls linearly from the stall torque at zero speed to zero at the free speed
+# (scaled by the duty cycle). The vehicle speed is expressed as motor speed in the first gear.
+free_speed = 900.0 # motor speed (degrees per second) at 100% duty without load
+time_constant = 0.3 # seconds to reach 63% of the speed in the first gear
+drag = 0.02 # speed loss per second, relative to the speed
+gear_ratios = np.array([1.0, 1.67, 3.0, 5.0]) # vehicle speed per motor speed for each gear
+acceleration = free_speed / time_constant # at stall torque in the first gear
+
+# The vehicle reached the top speed at this part of the steady speed in the highest gear at full power.
+top_speed_part = 0.9
+top_speed = (acceleration / gear_ratios[-1] /
+    (acceleration / (gear_ratios[-1] ** 2 * free_speed) + drag)) * top_speed_part
+
+# Columns of the gearbox tables varied for the candidates:
+# gear up RPM and time, gear down RPM and time, comfort compensation ratios and times.
+sport_columns = (2, 3, 5, 6)
+comfort_columns = (2, 3, 5, 6, 7, 8, 9, 10)
+
+# Default axis ranges of rov3r+: (minimum, maximum) of stick and trigger per gamepad type.
+default_ranges = {1: ((0, 65535), (0, 1023)), 2: ((0, 255), (0, 255))}
+bump_codes = {1: 9, 2: 5}
+
+# Format of the recording file, see "gamepad-record/record.py".
+record_magic = b"GPREC"
+record_header_format = '<5sBBB'
+record_header_size = struct.calcsize(record_header_format)
+record_event_format = '<IIHHi'
+record_event_size = struct.calcsize(record_event_format)
+
+def load_program():
+    """
+    Parses the program and returns tuple (sport table, comfort table, dictionary of function sources).
+    """
+    with open(program_path, "r") as fp:
+        source = fp.read()
+    tables = {}
+    functions = {}
+    for node in ast.parse(source).body:
+        if isinstance(node, ast.Assign) and isinstance(node.targets[0], ast.Name):
+            tables[node.targets[0].id] = node.value
+        elif isinstance(node, ast.FunctionDef) and node.name in program_functions:
+            functions[node.name] = ast.get_source_segment(source, node)
+    return (ast.literal_eval(tables["automatic_sport_gearbox"]),
+        ast.literal_eval(tables["automatic_comfort_gearbox"]), functions)
+
+def wheel_force(velocity, gear, duty):
+    """
+    Returns acceleration of the vehicle from the motor for the velocity, gear and duty cycle.
+    Works on scalars and on NumPy arrays.
+    """
+    ratio = gear_ratios[gear - 1]
+    torque = np.clip(duty, -100.0, 100.0) / 100.0 - velocity / ratio / free_speed
+    return acceleration * torque / ratio
+
+def motor_speed(velocity, gear):
+    """
+    Returns the motor speed as read by "first_motor.speed()".
+    """
+    return np.trunc(velocity / gear_ratios[gear - 1])
+
+def synthetic_traces():
+    """
+    Returns dictionary of throttle traces: name -> (power -100..100, bump 0..1) per control tick.
+    """
+    def steps(*parts):
+        return np.concatenate([np.full(int(duration * control_rate), float(power))
+            for (duration, power) in parts])
+    traces = {}
+    power = steps((0.5, 0), (30, 100), (5, 0))
+    traces["launch"] = (power, np.zeros(len(power)))
+    power = steps(*((4, 100), (3, 0)) * 4)
+    traces["stop and go"] = (power, np.zeros(len(power)))
+    power = np.concatenate((np.linspace(0, 100, 5 * control_rate), steps((10, 100)),
+        np.linspace(100, 60, 3 * control_rate), steps((10, 60)), np.linspace(60, 0, 5 * control_rate)))
+    traces["cruise"] = (np.round(power), np.zeros(len(power)))
+    power = steps((10, 80), (5, 0))
+    traces["bump"] = (power, np.concatenate((np.zeros(3 * control_rate),
+        np.ones(len(power) - 3 * control_rate))))
+    return traces
+
+def recorded_trace(path, functions):
+    """
+    Reads throttle trace from a gamepad recording, sampling stick and trigger at control ticks.
+    Stick values are transformed with the functions of the program.
+    """
+    namespace = {"array": array, "stick_deadzone": 5}
+    exec(functions["transform_stick"], namespace)
+    exec(functions["build_stick_table"], namespace)
+    with open(path, "rb") as in_file:
+        (magic, version, gamepad_type, reserved) = struct.unpack(record_header_format,
+            in_file.read(record_header_size))
+        if magic != record_magic:
+            raise ValueError("Not a gamepad recording: " + path)
+        data = in_file.read()
+    ((stick_min, stick_max), (trigger_min, trigger_max)) = default_ranges[gamepad_type]
+    (table, shift) = namespace["build_stick_table"]((stick_min, stick_max, 0, 0))
+    stick = (stick_min + stick_max) // 2
+    trigger = trigger_min
+    power = []
+    bump = []
+    next_tick = None
+    for pos in range(0, len(data) - record_event_size + 1, record_event_size):
+        (tv_sec, tv_usec, ev_type, code, value) = struct.unpack_from(record_event_format, data, pos)
+        event_time = tv_sec + tv_usec / 1000000
+        if next_tick is None:
+            next_tick = event_time
+        while next_tick < event_time:
+            power.append(-table[(stick - stick_min) >> shift])
+            bump.append((trigger - trigger_min) / (trigger_max - trigger_min + 1))
+            next_tick += dt
+        if ev_type == 3 and code == 1:
+            stick = value
+        elif ev_type == 3 and code == bump_codes[gamepad_type]:
+            trigger = value
+    return (np.array(power, dtype=float), np.array(bump, dtype=float))
+
+def simulate(tables, power, bump, comfort):
+    """
+    Runs the shift rules of "automatic_gearbox_control" and "comfort_compensation_control"
+    for all candidate tables (array: candidates x gears x columns) over the throttle trace.
+    Returns dictionary of metrics (arrays with a value per candidate) and the gear per tick.
+    """
+    count = tables.shape[0]
+    index = np.arange(count)
+    gear = np.ones(count, dtype=int)
+    velocity = np.zeros(count)
+    compensation = np.ones(count)
+    gear_up_time = np.zeros(count)
+    gear_down_time = np.zeros(count)
+    comfort_time = np.zeros(count)
+    comfort_factor = np.zeros(count)
+    comfort_duration = np.zeros(count)
+    shifts = np.zeros(count, dtype=int)
+    top_time = np.full(count, np.nan)
+    max_jump = np.zeros(count)
+    total_jump = np.zeros(count)
+    gears = np.zeros((len(power), count), dtype=np.int8)
+    # The program uses wall time, which is never 0 (0 means "not started")
+    start_time = 1000.0
+
+    for tick in range(len(power)):
+        current_time = start_time + tick * dt
+        power_pos = power[tick]
+        speed = np.abs(motor_speed(velocity, gear))
+        force_before = wheel_force(velocity, gear, power_pos * (1 + bump[tick]) * compensation)
+        previous_gear = gear.copy()
+
+        # Did we stop?
+        gear = np.where((abs(power_pos) == 0) & (speed == 0) & (gear > 1), 1, gear)
+
+        gear_data = tables[index, gear - 1]
+        compensation_in_progress = np.abs(compensation - 1.0) > 0.01
+
+        # Can we gear up?
+        condition = (abs(power_pos) >= gear_data[:, 1]) & (speed >= gear_data[:, 2]) & ~compensation_in_progress
+        start = condition & (gear_up_time == 0)
+        switch = (condition & ~start & (current_time - gear_up_time >= gear_data[:, 3]) &
+            (gear < tables.shape[1]))
+        gear_up_time = np.where(start, current_time, np.where(switch | ~condition, 0, gear_up_time))
+        gear = gear + switch
+        if comfort:
+            comfort_time = np.where(switch, current_time, comfort_time)
+            comfort_factor = np.where(switch, gear_data[:, 7], comfort_factor)
+            comfort_duration = np.where(switch, gear_data[:, 8], comfort_duration)
+            compensation = np.where(switch, gear_data[:, 7], compensation)
+
+        # Should we gear down?
+        condition = ((abs(power_pos) <= gear_data[:, 4]) |
+            (speed <= gear_data[:, 5]) & ~compensation_in_progress)
+        start = condition & (gear_down_time == 0)
+        switch = condition & ~start & (current_time - gear_down_time >= gear_data[:, 6]) & (gear > 1)
+        gear_down_time = np.where(start, current_time, np.where(switch | ~condition, 0, gear_down_time))
+        gear = gear - switch
+        if comfort:
+            comfort_time = np.where(switch, current_time, comfort_time)
+            comfort_factor = np.where(switch, gear_data[:, 9], comfort_factor)
+            comfort_duration = np.where(switch, gear_data[:, 10], comfort_duration)
+            compensation = np.where(switch, gear_data[:, 9], compensation)
+
+        # Comfort compensation
+        active = (comfort_time > 0) & (current_time > comfort_time)
+        duration = current_time - comfort_time
+        ramp = active & (duration < comfort_duration)
+        part = duration / np.where(ramp, comfort_duration, 1.0)
+        compensation = np.where(ramp, comfort_factor + (1.0 - comfort_factor) * part,
+            np.where(active, 1.0, compensation))
+        comfort_time = np.where(active & ~ramp, 0, comfort_time)
+
+        # Power discontinuity caused by the gearbox at the current speed
+        duty = power_pos * (1 + bump[tick]) * compensation
+        force = wheel_force(velocity, gear, duty)
+        jump = np.abs(force - force_before) / acceleration
+        max_jump = np.maximum(max_jump, jump)
+        total_jump += jump
+        shifts += gear != previous_gear
+
+        velocity = velocity + (force - drag * velocity) * dt
+        top_time = np.where(np.isnan(top_time) & (np.abs(velocity) >= top_speed), (tick + 1) * dt, top_time)
+        gears[tick] = gear
+
+    return ({"shifts": shifts, "top_time": top_time, "max_jump": max_jump,
+        "jump_per_shift": total_jump / np.maximum(shifts, 1)}, gears)
+
+def check_reference(table, power, bump, comfort, functions, gears):
+    """
+    Runs the functions of the program for one table over the trace with stub motors
+    and compares the selected gears with the vectorized simulation.
+    Returns the first tick with a different gear or None.
+    """
+    class StubMotor:
+        duty = 0
+        def dc(self, duty, event_time=0):
+            StubMotor.duty = duty
+        def stop(self, stop_type=None, event_time=0):
+            pass
+        def track_target(self, angle, event_time=0):
+            pass
+        def speed(self):
+            return int(motor_speed(state["velocity"], namespace["gear"]))
+
+    class StubStop:
+        COAST = 0
+
+    class StubTime:
+        @staticmethod
+        def time():
+            return state["time"]
+
+    class StubUtime:
+        @staticmethod
+        def ticks_ms():
+            return int(round(state["time"] * 1000))
+        @staticmethod
+        def ticks_diff(end, start):
+            return end - start
+
+    # The program uses fixed-point power factors
+    fixed_shift = 10
+    fixed_one = 1 << fixed_shift
+    state = {"velocity": 0.0, "time": 1000.0}
+    namespace = {"time": StubTime, "utime": StubUtime, "fixed_shift": fixed_shift, "fixed_one": fixed_one,
+        "first_motor": StubMotor(), "second_motor": StubMotor(),
+        "gearbox_motor": StubMotor(), "Stop": StubStop, "motors": 1, "frame_event_time": 0,
+        "gearbox_auto_comfort": 3, "gearbox_mode": 3 if comfort else 2,
+        "automatic_comfort_gearbox": table, "automatic_sport_gearbox": table,
+        "gear": 1, "power_pos": 0, "power_bump": 0, "power_compensation": fixed_one,
+        "gear_up_time": 0, "gear_down_time": 0, "comfort_time": None, "comfort_factor": 0,
+        "comfort_duration": 0}
+    for name in ("propulsion_power", "drive", "switch_gear", "reset_automatic_gearbox",
+            "automatic_gearbox_control", "comfort_compensation_control"):
+        exec(functions[name], namespace)
+
+    for tick in range(len(power)):
+        state["time"] = 1000.0 + tick * dt
+        namespace["drive"](int(power[tick]), int(bump[tick] * fixed_one), None)
+        namespace["automatic_gearbox_control"]()
+        namespace["comfort_compensation_control"]()
+        if namespace["gear"] != gears[tick]:
+            return tick
+        # The motor runs with the last duty cycle sent by the program
+        duty = namespace["propulsion_power"]()
+        force = wheel_force(state["velocity"], namespace["gear"], duty)
+        state["velocity"] = state["velocity"] + (force - drag * state["velocity"]) * dt
+    return None
+
+def make_candidates(base, columns, count, spread, seed):
+    """
+    Returns candidate tables (array: candidates x gears x columns), the first one is the base table.
+    Values in the given columns are scaled by random factors within 1 +- spread.
+    """
+    random = np.random.default_rng(seed)
+    tables = np.repeat(np.array(base, dtype=float)[np.newaxis], count, axis=0)
+    for column in columns:
+        factors = random.uniform(1 - spread, 1 + spread, (count - 1, tables.shape[1]))
+        tables[1:, :, column] *= factors
+    return tables
+
+def format_table(table, columns):
+    """
+    Formats a table as Python source for pasting into the program.
+    """
+    lines = ["("]
+    for (gear, row) in enumerate(table):
+        values = ", ".join(("%g" % (round(value) if abs(value) >= 10 else round(value, 2)))
+            for value in row)
+        end = ")" if gear == len(table) - 1 else ","
+        lines.append("    (%s)%s # Gear %d" % (values, end, gear + 1))
+    return "\n".join(lines)
+
+def main(args):
+    comfort = "--comfort" in args
+    count = 2000
+    spread = 0.3
+    seed = 0
+    paths = []
+    pos = 0
+    while pos < len(args):
+        if args[pos] == "--candidates":
+            count = int(args[pos + 1])
+            pos += 1
+        elif args[pos] == "--spread":
+            spread = float(args[pos + 1])
+            pos += 1
+        elif args[pos] == "--seed":
+            seed = int(args[pos + 1])
+            pos += 1
+        elif not args[pos].startswith("--"):
+            paths.append(args[pos])
+        pos += 1
+
+    (sport_table, comfort_table, functions) = load_program()
+    base = comfort_table if comfort else sport_table
+    columns = comfort_columns if comfort else sport_columns
+    tables = make_candidates(base, columns, count, spread, seed)
+
+    if paths:
+        traces = dict((os.path.basename(path), recorded_trace(path, functions)) for path in paths)
+    else:
+        traces = synthetic_traces()
+
+    print("Gearbox:", "comfort" if comfort else "sport", ", candidates:", count, ", traces:", len(traces))
+    shifts = np.zeros(count, dtype=int)
+    max_jump = np.zeros(count)
+    jump_per_shift = np.zeros(count)
+    top_time = np.zeros(count)
+    for (name, (power, bump)) in traces.items():
+        (metrics, gears) = simulate(tables, power, bump, comfort)
+        mismatch = check_reference(base, power, bump, comfort, functions, gears[:, 0])
+        if mismatch is not None:
+            print("Warning: simulation differs from the program at tick", mismatch, "of trace", name)
+        print("Trace %s: %.1f s, base table: %d shifts, top speed after %s s, max power jump %.2f" %
+            (name, len(power) * dt, metrics["shifts"][0],
+            "%.2f" % metrics["top_time"][0] if not np.isnan(metrics["top_time"][0]) else "-",
+            metrics["max_jump"][0]))
+        shifts += metrics["shifts"]
+        max_jump = np.maximum(max_jump, metrics["max_jump"])
+        jump_per_shift = np.maximum(jump_per_shift, metrics["jump_per_shift"])
+        # Only traces where the base table reaches the top speed count for the acceleration,
+        # candidates which don't reach it there are ranked last
+        if not np.isnan(metrics["top_time"][0]):
+            top_time += np.where(np.isnan(metrics["top_time"]), np.inf, metrics["top_time"])
+
+    # Best acceleration first, then fewer shifts, then smaller power jumps
+    order = np.lexsort((max_jump, shifts, top_time))
+    print()
+    print("Rank  Candidate  Top speed (s)  Shifts  Max jump  Jump/shift")
+    for (rank, candidate) in enumerate(order[:10]):
+        print("%4d  %9d  %13.2f  %6d  %8.2f  %10.3f" % (rank + 1, candidate, top_time[candidate],
+            shifts[candidate], max_jump[candidate], jump_per_shift[candidate]))
+    rank = int(np.nonzero(order == 0)[0][0])
+    print("%4d  %9s  %13.2f  %6d  %8.2f  %10.3f" % (rank + 1, "base", top_time[0],
+        shifts[0], max_jump[0], jump_per_shift[0]))
+    print()
+    print("Best table:")
+    print(format_table(tables[order[0]], columns))
+
+main(sys.argv[1:])
@@ -1,13 +1,23 @@
 #!/usr/bin/env pybricks-micropython
  
 from pybricks.ev3devices import (Motor)
-from pybricks.parameters import (Port, SoundFile)
+from pybricks.parameters import (Port, SoundFile, Stop)
 from pybricks import ev3brick as brick
 from pybricks.tools import print
 import time
 import struct
 import sys
 import random
+import _thread
+import gc
+import uselect
+import utime
+from array import array
+
+# Modules shared by the programs of this repository are in directory "common"
+# next to the program directory, or copied to the program directory
+sys.path.append(__file__[:__file__.rfind("/") + 1] + "../common")
+from motor_control import CachedMotor, Mixer, fixed_shift, fixed_one
 
 random.seed(0)
 
@@ -22,10 +32,13 @@ enable_ps_detection = True
 brick.display.clear()
 brick.display.text("Gidd3", (60, 20))
 
+# Minimum change of motor power (in percent) sent to the motors
+motor_dc_epsilon = 1
+
 # Declare motors
 try:
-    left_motor = Motor(Port.B)
-    right_motor = Motor(Port.C)
+    left_motor = CachedMotor(Motor(Port.B), motor_dc_epsilon)
+    right_motor = CachedMotor(Motor(Port.C), motor_dc_epsilon)
 except:
     brick.display.text("Check motor cables", (0, 80))
     brick.sound.file(SoundFile.ERROR_ALARM)
@@ -36,23 +49,119 @@ except:
 gamepad_xbox = 1
 gamepad_ps = 2
 
+# Differential drive mixer, see class "Mixer". The trim (percent of the power of the motor,
+# lower it for the faster motor if the vehicle pulls to one side) and the response curve
+# (0 is linear, up to 100 gives finer control at low powers) are applied by lookup tables
+# Steering sensitivity is a fixed-point integer with "fixed_shift" fractional bits,
+# "fixed_one" stands for 1.0
+left_motor_trim = 100
+right_motor_trim = 100
+motor_curve = 0
+mixer = Mixer(left_motor, right_motor, left_motor_trim, right_motor_trim, motor_curve)
+
 # Initialize variables. 
 # Assuming sticks are in the middle and triggera are not pressed when starting
 left_stick_x = 0
 left_stick_y = 0
-right_trigger = 0
+steering_sensitivity = fixed_one # 1 - right trigger / 1.1
 
 gamepad_device = None
 gamepad_type = 0 # gamepad_xbox or gamepad_ps
+in_file = None
+
+# Period (in seconds) of looking for the gamepad while it's disconnected
+gamepad_rescan_period = 0.2
+gamepad_disconnect_count = 0
+
+# Input watchdog: if no gamepad events arrive for "input_watchdog_timeout" milliseconds
+# while the stick is off-center, the motors are stopped with "input_watchdog_stop"
+# (Stop.COAST or Stop.BRAKE) and the stick is centered. A lost gamepad (read error,
+# device gone) stops the motors without the watchdog, see "read_events".
+# The gamepad sends no events while the stick is held still, so the watchdog also stops
+# the vehicle when the stick is held steady for longer than the timeout. Therefore it's
+# disabled (None) by default. If enabled, the timeout must be longer than the stick
+# is ever held still, for example 5000.
+input_watchdog_timeout = None
+input_watchdog_stop = Stop.COAST
+input_watchdog_count = 0 # number of times the watchdog stopped the motors
+input_watchdog_max_detection = 0 # longest time (ms) from the last events to stopping the motors
+last_event_time = utime.ticks_ms()
+
+# Waiting for events with a timeout, so the watchdog runs while the gamepad is silent
+event_poll = uselect.poll()
+
+# Garbage collection: automatic collections are disabled, so that a collection never
+# pauses processing of gamepad events. The memory is collected in idle gaps instead:
+# no events are pending and the input watchdog isn't due before the collection ends
+# (judging by the average collection so far). It collects at most every "gc_idle_period"
+# milliseconds and only after at least "gc_idle_allocated" bytes were allocated since
+# the last collection. If free memory drops below "gc_min_free" bytes while events keep
+# coming, the memory is collected right away after processing the events
+gc_idle_period = 200
+gc_idle_allocated = 4096
+gc_min_free = 16384
+gc_idle_count = 0 # number of collections in idle gaps
+gc_forced_count = 0 # number of collections because of low free memory
+gc_pause_total = 0 # time spent collecting in microseconds
+gc_pause_max = 0 # longest collection in microseconds
+gc_last_time = utime.ticks_ms() # time of the last collection
+gc_last_alloc = 0 # allocated memory after the last collection
+# Desktop Python has no "gc.mem_free" and "gc.mem_alloc", there the memory
+# is collected in idle gaps only and without looking at the allocated memory
+gc_can_measure = hasattr(gc, "mem_free")
+
 # True if Xbox or False if PlayStation
 xbox = None
 
+# Default bindings of gamepad events to actions for each gamepad type:
+# (event type, event code, action name). Event type 1 is a button, 3 is an axis.
+default_bindings = {
+    gamepad_xbox: (
+        (3, 0, "steering"), # Left Stick Horz. Axis
+        (3, 1, "throttle"), # Left Stick Vert. Axis
+        (3, 9, "sensitivity"), # Right Trigger
+        (1, 304, "horn"), # A
+        (1, 305, "sound_effect")), # B
+    gamepad_ps: (
+        (3, 0, "steering"), # Left Stick Horz. Axis
+        (3, 1, "throttle"), # Left Stick Vert. Axis
+        (3, 5, "sensitivity"), # R2 paddle
+        (1, 304, "horn"), # X
+        (1, 305, "sound_effect"))} # O
+
+# Optional file with custom bindings, overriding the default bindings.
+# Each line has the format "<xbox|ps> <event type> <event code> <action|none>",
+# for example "xbox 1 307 horn". Use program "xbox-info" to find event codes.
+bindings_file = "bindings.txt"
+
+# Dispatch table mapping event keys (event type << 16 | event code) to handler functions
+gamepad_dispatch = {}
+
+# Default axis ranges (minimum, maximum, fuzz, flat) of sticks and triggers,
+# used when the ranges can't be queried from the gamepad
+default_stick_range = {gamepad_xbox: (0, 65535, 0, 0), gamepad_ps: (0, 255, 0, 0)}
+default_trigger_range = {gamepad_xbox: (0, 1023, 0, 0), gamepad_ps: (0, 255, 0, 0)}
+
+# Lookup tables for stick values with minimum values of the axes and the bit shifts
+# for quantizing stick values
+stick_x_table = None
+stick_x_min = 0
+stick_x_shift = 0
+stick_y_table = None
+stick_y_min = 0
+stick_y_shift = 0
+
+# Minimum value and size of range of the right trigger (paddle)
+trigger_min = 0
+trigger_range = 1
+
 def find_controller():
     """
     Checks device list by reading content of virtual file "/proc/bus/input/devices"
     looking for gamepad device.
     """
     global gamepad_type
+    gamepad_type = 0
     with open("/proc/bus/input/devices", "r") as fp:
         line = fp.readline()
         while line:
@@ -68,30 +177,167 @@ def find_controller():
             line = fp.readline()
     return None
 
-def transform_stick(value):
+def read_axis_range(device_file, axis, default):
+    """
+    Query range of a gamepad axis via ioctl EVIOCGABS.
+    Returns tuple (minimum, maximum, fuzz, flat) or the default if the gamepad can't be queried
+    """
+    # struct input_absinfo: value, minimum, maximum, fuzz, flat, resolution
+    absinfo = bytearray(24)
+    request = 0x80184540 + axis # EVIOCGABS(axis)
+    try:
+        try:
+            import fcntl
+            fcntl.ioctl(device_file.fileno(), request, absinfo)
+        except ImportError:
+            # MicroPython has no module "fcntl", call ioctl from the C library directly
+            import ffi
+            ioctl = ffi.open("libc.so.6").func("i", "ioctl", "iLp")
+            if ioctl(device_file.fileno(), request, absinfo) != 0:
+                return default
+    except (ImportError, OSError):
+        return default
+    (value, minimum, maximum, fuzz, flat, resolution) = struct.unpack('6i', absinfo)
+    if maximum <= minimum:
+        return default
+    return (minimum, maximum, fuzz, flat)
+
+def set_nonblocking(device_file):
+    """
+    Switches the opened device file to non-blocking mode. On MicroPython a blocking read
+    waits until the whole buffer is filled, a non-blocking read returns the pending events
+    at once (None if there are none)
+    """
+    try:
+        import os
+        os.set_blocking(device_file.fileno(), False)
+    except (ImportError, AttributeError):
+        # MicroPython has no "os.set_blocking", call fcntl from the C library directly
+        import ffi
+        fcntl = ffi.open("libc.so.6").func("i", "fcntl", "iii")
+        flags = fcntl(device_file.fileno(), 3, 0) # F_GETFL
+        fcntl(device_file.fileno(), 4, flags | 0x800) # F_SETFL, O_NONBLOCK
+
+def transform_stick(value, minimum, maximum, flat):
     """
-    Transform range 0..max to -100..100, remove deadzone from the range
+    Transform range minimum..maximum to -100..100, remove deadzone from the range.
+    The deadzone is the larger one of "stick_deadzone" and the flat zone of the axis.
+    Integer math, the result is rounded to the nearest integer
     """
-    max = 65535 if xbox else 255
-    half = int((max + 1) / 2)
-    deadzone = int((max + 1) / 100 * stick_deadzone)
-    value -= half
-    if abs(value) < deadzone:
-        value = 0
+    half = (maximum - minimum + 1) // 2
+    deadzone = max((maximum - minimum + 1) * stick_deadzone // 100, flat)
+    value -= minimum + half
+    if abs(value) <= deadzone:
+        return 0
     elif value > 0:
-        value = (value - deadzone - 1) / (half - deadzone) * 100
+        return ((value - deadzone - 1) * 200 + half - deadzone) // (2 * (half - deadzone))
     else:
-        value = (value + deadzone) / (half - deadzone) * 100
-    return value
+        return -(((-value - deadzone) * 200 + half - deadzone) // (2 * (half - deadzone)))
+
+def build_stick_table(axis_range):
+    """
+    Builds lookup table for transforming stick values from the axis range to -100..100.
+    Sticks with more than 256 positions are quantized to 256 table entries.
+    Returns the table and the bit shift to apply to the stick value (minus axis minimum)
+    before the lookup
+    """
+    (minimum, maximum, fuzz, flat) = axis_range
+    shift = 0
+    while ((maximum - minimum) >> shift) > 255:
+        shift += 1
+    table = array('b', bytes(((maximum - minimum) >> shift) + 1))
+    for index in range(len(table)):
+        # Use the middle of the quantization step as representative value
+        value = minimum + (index << shift) + ((1 << shift) >> 1)
+        table[index] = transform_stick(min(value, maximum), minimum, maximum, flat)
+    return (table, shift)
+
+def probe_controller(device_file, bindings):
+    """
+    Query ranges of the gamepad axes bound to steering, throttle and sensitivity
+    and build lookup tables for them
+    """
+    global stick_x_table, stick_x_min, stick_x_shift
+    global stick_y_table, stick_y_min, stick_y_shift
+    global trigger_min, trigger_range
+
+    for key in bindings:
+        action = bindings[key]
+        code = key & 0xFFFF
+        if action == "steering":
+            stick_range = read_axis_range(device_file, code, default_stick_range[gamepad_type])
+            (stick_x_table, stick_x_shift) = build_stick_table(stick_range)
+            stick_x_min = stick_range[0]
+        elif action == "throttle":
+            stick_range = read_axis_range(device_file, code, default_stick_range[gamepad_type])
+            (stick_y_table, stick_y_shift) = build_stick_table(stick_range)
+            stick_y_min = stick_range[0]
+        elif action == "sensitivity":
+            (trigger_min, maximum, fuzz, flat) = read_axis_range(device_file, code, default_trigger_range[gamepad_type])
+            trigger_range = maximum - trigger_min + 1
+
+def decode_u16(buffer, pos):
+    """
+    Decodes unsigned short (little-endian) at the given position of the buffer
+    """
+    return buffer[pos] | (buffer[pos + 1] << 8)
+
+def decode_s32(buffer, pos):
+    """
+    Decodes signed 32-bit integer (little-endian) at the given position of the buffer
+    """
+    value = buffer[pos] | (buffer[pos + 1] << 8) | (buffer[pos + 2] << 16)
+    if buffer[pos + 3] & 0x80:
+        return value + ((buffer[pos + 3] - 256) << 24)
+    return value + (buffer[pos + 3] << 24)
+
+# Sound requests (function, argument) waiting to be played by the sound thread
+# The queue is short, so that the sounds always follow the actions of the driver
+sound_queue_size = 2
+sound_queue = []
+sound_lock = _thread.allocate_lock()
+sound_dropped_count = 0 # number of requests dropped because the queue was full
+
+# Period (in milliseconds) of checking the queue when there are no sound requests
+sound_idle_period = 20
+
+def queue_sound(function, argument):
+    """
+    Queues a sound request for the sound thread: function "function" of "brick.sound"
+    is called with "argument". If the queue is full the oldest request is dropped
+    """
+    global sound_dropped_count
+    sound_lock.acquire()
+    if len(sound_queue) >= sound_queue_size:
+        sound_queue.pop(0)
+        sound_dropped_count += 1
+    sound_queue.append((function, argument))
+    sound_lock.release()
+
+def sound_thread():
+    """
+    Plays queued sounds. Runs in a background thread, so that playing sounds
+    never blocks processing of gamepad events
+    """
+    while True:
+        request = None
+        sound_lock.acquire()
+        if len(sound_queue) > 0:
+            request = sound_queue.pop(0)
+        sound_lock.release()
+        if request is None:
+            time.sleep(sound_idle_period / 1000)
+        else:
+            request[0](request[1])
 
 def play_horn():
     """
     Plays a horn sound randomly selected from two available sounds
     """
     if random.randint(1, 2) == 1:
-        brick.sound.file(SoundFile.HORN_1)
+        queue_sound(brick.sound.file, SoundFile.HORN_1)
     else:
-        brick.sound.file(SoundFile.HORN_2)
+        queue_sound(brick.sound.file, SoundFile.HORN_2)
 
 def play_sound_effect():
     """
@@ -99,76 +345,293 @@ def play_sound_effect():
     """
     effect = random.randint(1, 4)
     if effect == 1:
-        brick.sound.file(SoundFile.AIR_RELEASE)
+        queue_sound(brick.sound.file, SoundFile.AIR_RELEASE)
     elif effect == 2:
-        brick.sound.file(SoundFile.AIRBRAKE)
+        queue_sound(brick.sound.file, SoundFile.AIRBRAKE)
     elif effect == 3:
-        brick.sound.file(SoundFile.LASER)
+        queue_sound(brick.sound.file, SoundFile.LASER)
     elif effect == 4:
-        brick.sound.file(SoundFile.SONAR)
+        queue_sound(brick.sound.file, SoundFile.SONAR)
+
+# Handlers of gamepad events, called with the value of the event
+
+def on_steering(value):
+    global left_stick_x
+    left_stick_x = stick_x_table[(value - stick_x_min) >> stick_x_shift]
+
+def on_throttle(value):
+    global left_stick_y
+    left_stick_y = stick_y_table[(value - stick_y_min) >> stick_y_shift]
+
+def on_sensitivity(value):
+    global steering_sensitivity
+    # 1 - trigger / 1.1, the trigger reduces the steering to 1/11 when fully pressed
+    steering_sensitivity = fixed_one - ((value - trigger_min) << fixed_shift) * 10 // (11 * trigger_range)
+
+def on_horn(value):
+    if value == 1:
+        play_horn()
+
+def on_sound_effect(value):
+    if value == 1:
+        play_sound_effect()
+
+# Actions which can be bound to gamepad events
+gamepad_actions = {
+    "steering": on_steering,
+    "throttle": on_throttle,
+    "sensitivity": on_sensitivity,
+    "horn": on_horn,
+    "sound_effect": on_sound_effect}
+
+def load_bindings():
+    """
+    Return bindings for the detected gamepad type as dictionary mapping
+    event keys (event type << 16 | event code) to action names.
+    Default bindings are overridden by the bindings file, if it exists
+    """
+    bindings = {}
+    for (ev_type, code, action) in default_bindings[gamepad_type]:
+        bindings[(ev_type << 16) | code] = action
+    gamepad_name = "xbox" if xbox else "ps"
+    try:
+        with open(bindings_file, "r") as fp:
+            for line in fp:
+                fields = line.split("#")[0].split()
+                if len(fields) == 4 and fields[0] == gamepad_name:
+                    key = (int(fields[1]) << 16) | int(fields[2])
+                    if fields[3] == "none":
+                        bindings.pop(key, None)
+                    elif fields[3] in gamepad_actions:
+                        bindings[key] = fields[3]
+                    else:
+                        print("Unknown action in bindings file:", fields[3])
+    except OSError:
+        pass # no bindings file, use default bindings
+    return bindings
+
+def compile_bindings(bindings):
+    """
+    Build dispatch table mapping event keys directly to the handler functions
+    """
+    dispatch = {}
+    for key in bindings:
+        dispatch[key] = gamepad_actions[bindings[key]]
+    return dispatch
+
+def attach_controller():
+    """
+    Prepares processing of events from the opened gamepad device file:
+    loads bindings and queries axis ranges
+    """
+    global xbox, gamepad_dispatch
+    xbox = gamepad_type == gamepad_xbox
+    bindings = load_bindings()
+    probe_controller(in_file, bindings)
+    gamepad_dispatch = compile_bindings(bindings)
+    set_nonblocking(in_file)
+    event_poll.register(in_file, uselect.POLLIN)
+
+def connect_controller():
+    """
+    Looks for the gamepad and opens its device file.
+    Returns True if the gamepad is ready
+    """
+    global gamepad_device, in_file
+    gamepad_device = find_controller()
+    if gamepad_device is None:
+        return False
+    try:
+        in_file = open("/dev/input/" + gamepad_device, "rb", buffering=0)
+    except OSError:
+        # The device file may appear a little later than the device
+        return False
+    attach_controller()
+    return True
+
+def wait_for_controller():
+    """
+    Looks for the gamepad until it's connected. Scanning the device list allocates memory,
+    it's collected while waiting, as automatic garbage collection is disabled
+    """
+    while not connect_controller():
+        time.sleep(gamepad_rescan_period)
+        gc.collect()
+
+def input_watchdog():
+    """
+    Stops the motors and centers the stick after no events arrived for the watchdog timeout
+    """
+    global left_stick_x, left_stick_y, input_watchdog_count, input_watchdog_max_detection
+    detection = utime.ticks_diff(utime.ticks_ms(), last_event_time)
+    left_motor.stop(input_watchdog_stop)
+    right_motor.stop(input_watchdog_stop)
+    left_stick_x = 0
+    left_stick_y = 0
+    input_watchdog_count += 1
+    input_watchdog_max_detection = max(input_watchdog_max_detection, detection)
+    print("No gamepad events for", detection, "ms, motors stopped")
+
+def collect_garbage(forced):
+    """
+    Collects garbage and records the length of the pause
+    """
+    global gc_idle_count, gc_forced_count, gc_pause_total, gc_pause_max, gc_last_time, gc_last_alloc
+    start = utime.ticks_us()
+    gc.collect()
+    pause = utime.ticks_diff(utime.ticks_us(), start)
+    gc_pause_total += pause
+    if pause > gc_pause_max:
+        gc_pause_max = pause
+    if forced:
+        gc_forced_count += 1
+    else:
+        gc_idle_count += 1
+    gc_last_time = utime.ticks_ms()
+    if gc_can_measure:
+        gc_last_alloc = gc.mem_alloc()
+
+def collect_garbage_when_idle(time_left):
+    """
+    Collects garbage while no events are pending, see "gc_idle_period".
+    "time_left" is the time (ms) until the input watchdog is due, None if it isn't active
+    """
+    if (utime.ticks_diff(utime.ticks_ms(), gc_last_time) < gc_idle_period or
+            gc_can_measure and gc.mem_alloc() - gc_last_alloc < gc_idle_allocated or
+            event_poll.poll(0)):
+        return
+    pause = gc_pause_total // max(gc_idle_count + gc_forced_count, 1)
+    if time_left is None or time_left * 1000 > pause:
+        collect_garbage(False)
+
+def check_free_memory():
+    """
+    Collects garbage right away if free memory is low
+    """
+    if gc_can_measure and gc.mem_free() < gc_min_free:
+        collect_garbage(True)
+
+def read_events():
+    """
+    Reads pending events into the event buffer. If the gamepad was disconnected
+    stops the motors and waits until the gamepad is back. While the stick is off-center
+    waits for events at most until the deadline of the input watchdog.
+    Returns number of bytes read, 0 at the end of the file given on the command line
+    """
+    global in_file, gamepad_disconnect_count, left_stick_x, left_stick_y, last_event_time
+    check_free_memory()
+    while True:
+        time_left = None
+        if input_watchdog_timeout is not None and (left_stick_x or left_stick_y):
+            time_left = input_watchdog_timeout - utime.ticks_diff(utime.ticks_ms(), last_event_time)
+        collect_garbage_when_idle(time_left)
+        # The device file is non-blocking, wait until events are pending
+        timeout = -1
+        if time_left is not None:
+            timeout = max(input_watchdog_timeout - utime.ticks_diff(utime.ticks_ms(), last_event_time), 0)
+        if not event_poll.poll(timeout):
+            input_watchdog()
+            continue
+        try:
+            size = in_file.readinto(event_buffer)
+        except OSError:
+            # Reading fails after the gamepad was disconnected
+            size = 0
+        if size is None:
+            # No events pending after all
+            continue
+        if size:
+            last_event_time = utime.ticks_ms()
+        if size or gamepad_device is None:
+            return size
+
+        gamepad_disconnect_count += 1
+        left_motor.dc(0)
+        right_motor.dc(0)
+        left_stick_x = 0
+        left_stick_y = 0
+        event_poll.unregister(in_file)
+        try:
+            in_file.close()
+        except OSError:
+            pass
+        brick.display.text("Waiting for gamepad", (0, 110))
+        queue_sound(brick.sound.beeps, 2)
+        wait_for_controller()
+        brick.display.text("                   ", (0, 110))
+        queue_sound(brick.sound.beeps, 1)
+
+# Start playing sounds in background
+_thread.start_new_thread(sound_thread, ())
 
 # Find the Xbox Controller:
 # /dev/input/event2 is the usual file handler for the gamepad.
 # The contents of /proc/bus/input/devices lists all devices.
-gamepad_device = find_controller()
+# Events can also be read from a file given on the command line instead,
+# for example from a FIFO fed by "gamepad-record/replay.py":
+#   gidd3.py <file> [xbox|ps]
+# If the gamepad isn't connected yet, wait for it.
+if len(sys.argv) > 1:
+    gamepad_type = gamepad_ps if sys.argv[2:] == ["ps"] else gamepad_xbox
+    in_file = open(sys.argv[1], "rb", buffering=0)
+    attach_controller()
+elif not connect_controller():
+    brick.display.text("Waiting for gamepad", (0, 80))
+    wait_for_controller()
+    brick.display.clear()
+    brick.display.text("Gidd3", (60, 20))
 #print("Gamepad device:", gamepad_device, ", type:", gamepad_type)
 
-xbox = gamepad_type == gamepad_xbox
-
-if gamepad_device is None:
-    brick.display.text("Gamepad not found", (0, 80))
-    brick.sound.file(SoundFile.ERROR_ALARM)
-    time.sleep(10)
-    sys.exit(1)
-
 brick.display.text(("Xbox" if xbox else "PS") + " gamepad functions:", (0, 40))
 brick.display.text("Left Stick: movement", (0, 60))
 brick.display.text(("RT" if xbox else "R2") + ": steering sensitiv.", (0, 70))
 brick.display.text(("A" if xbox else "X") + ": horn", (0, 80))
 brick.display.text(("B" if xbox else "O") + ": sound effect", (0, 90))
 
-infile_path = "/dev/input/" + gamepad_device
-in_file = open(infile_path, "rb")
-
 # Read from the file
-# long int, long int, unsigned short, unsigned short, long int
-FORMAT = 'llHHl'
+# long int, long int, unsigned short, unsigned short, int
+# (the value is a 32-bit int, the same as long int on the EV3 brick)
+FORMAT = 'llHHi'
 EVENT_SIZE = struct.calcsize(FORMAT)
-event = in_file.read(EVENT_SIZE)
 
-num = 1
-while event:
-    (tv_sec, tv_usec, ev_type, code, value) = struct.unpack(FORMAT, event)
+# Events are read in batches into a preallocated buffer and decoded in place,
+# so no memory is allocated per event
+EVENT_BATCH = 16
+TYPE_OFFSET = struct.calcsize('ll')
+CODE_OFFSET = TYPE_OFFSET + 2
+VALUE_OFFSET = TYPE_OFFSET + 4
+event_buffer = bytearray(EVENT_SIZE * EVENT_BATCH)
+gc.collect()
+gc.disable()
+size = read_events()
 
-    if ev_type == 3 or ev_type == 1:
-
-        if ev_type == 3 and code == 0: # Left Stick Horz. Axis
-            left_stick_x = transform_stick(value)
-
-        elif ev_type == 3 and code == 1: # Left Stick Vert. Axis
-            left_stick_y = transform_stick(value)
-
-        elif xbox and ev_type == 3 and code == 9: # Right Trigger
-            right_trigger = value / 1024
-
-        elif not xbox and ev_type == 3 and code == 5: # R2 paddle
-            right_trigger = value / 256
+num = 1
+while size:
+    for pos in range(0, size, EVENT_SIZE):
+        ev_type = decode_u16(event_buffer, pos + TYPE_OFFSET)
+        code = decode_u16(event_buffer, pos + CODE_OFFSET)
 
-        elif ev_type == 1 and code == 304 and value == 1:  # A pressed
-            play_horn()
+        # Events without bindings are dropped after one lookup
+        handler = gamepad_dispatch.get((ev_type << 16) | code)
+        if handler is not None:
+            handler(decode_s32(event_buffer, pos + VALUE_OFFSET))
 
-        elif ev_type == 1 and code == 305 and value == 1:  # B pressed
-            play_sound_effect()
+            #print(left_stick_y, left_stick_x)
 
-        #print(left_stick_y, left_stick_x)
+            # Set motor voltages. If we're steering left, the left motor
+            # must run backwards so it has a -X component
+            # It has a Y component for going forward too. 
+            mixer.mix(left_stick_y, left_stick_x, steering_sensitivity)
 
-        # Set motor voltages. If we're steering left, the left motor
-        # must run backwards so it has a -X component
-        # It has a Y component for going forward too. 
-        left_motor.dc(left_stick_y - left_stick_x * (1 - right_trigger / 1.1))
-        right_motor.dc(left_stick_y + left_stick_x * (1 - right_trigger / 1.1))
+    # Finally, read more events
+    size = read_events()
 
-    # Finally, read another event
-    event = in_file.read(EVENT_SIZE)
+in_file.close()
 
-in_file.close()
\ No newline at end of file
+print("Motor commands:", left_motor.issued + right_motor.issued,
+    ", suppressed:", left_motor.suppressed + right_motor.suppressed)
+print("Sound requests dropped:", sound_dropped_count)
+print("Input watchdog: fired", input_watchdog_count, "times, worst detection time:",
+    input_watchdog_max_detection, "ms")
+print("Garbage collections: idle:", gc_idle_count, ", forced:", gc_forced_count,
+    ", pause avg:", gc_pause_total // max(gc_idle_count + gc_forced_count, 1), "us, max:", gc_pause_max, "us")
@@ -19,14 +19,25 @@
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from pybricks.ev3devices import (Motor)
-from pybricks.parameters import (Port, SoundFile, Stop, Direction)
+from pybricks.parameters import (Port, SoundFile, Stop, Direction, Color)
 from pybricks import ev3brick as brick
 from pybricks.tools import print
 import time
 import struct
 import sys
 import random
+import socket
+import _thread
+import gc
+import uasyncio
 import uselect
+import utime
+from array import array
+
+# Modules shared by the programs of this repository are in directory "common"
+# next to the program directory, or copied to the program directory.
+sys.path.append(__file__[:__file__.rfind("/") + 1] + "../common")
+from motor_control import CachedMotor
 
 random.seed(0)
 
@@ -39,6 +50,25 @@ stick_deadzone = 5  # deadzone 5%
 # Here initialized with default value for debug purposes.
 max_steering_angle = 300
 
+# Part of the range between the steering end stops used for steering.
+steering_limit = 0.90
+
+# Angle of the gearbox motor in the first gear relative to the end stop (in degrees).
+gearbox_zero_offset = -20
+
+# Calibration results are saved to this file and verified on the next start
+# by a short move of the motors to one end stop at low power. The steering is
+# centered and the first gear is selected at exit, so the end stops are expected
+# at known distances. The full calibration is done if the verification fails,
+# if a brick button is held while the program starts or if button "calibrate"
+# is held for "calibration_hold_time" milliseconds.
+calibration_file = "calibration.txt"
+calibration_power = 30 # duty limit (in percent) when verifying the calibration
+steering_calibration_tolerance = 20 # degrees
+gearbox_calibration_tolerance = 10 # degrees
+calibration_hold_time = 2000
+calibrate_press_time = None # time when button "calibrate" was pressed
+
 # One of these can be disabled if you have connected both gamepads and want to use a particular one.
 enable_xbox_detection = True
 enable_ps_detection = True
@@ -47,10 +77,126 @@ enable_ps_detection = True
 gamepad_xbox = 1
 gamepad_ps = 2
 
+# All connected gamepads control the vehicle, for example a driver and a co-driver.
+# Events of a gamepad are ignored while a gamepad with a higher priority has sent events
+# within the last "gamepad_override_time" milliseconds, so an instructor can take over.
+# Gamepads with the same priority control the vehicle together.
+# The priority of each connected gamepad is taken from the first entry (text, priority)
+# whose text is part of the name, the physical address or the unique id (Bluetooth address)
+# of the gamepad, as listed in "/proc/bus/input/devices". Other gamepads have priority 0.
+# For example (("12:34:56:78:9a:bc", 1),) lets the gamepad with this address take over.
+gamepad_priorities = ()
+gamepad_override_time = 1000
+
 # Gamepad state.
-gamepad_device = None
-gamepad_type = 0 # gamepad_xbox or gamepad_ps
-xbox = None # True if Xbox or False if PlayStation
+gamepads = [] # connected gamepads, see class "Gamepad"
+current_gamepad = None # gamepad whose axis tables are selected
+xbox = None # True if the first gamepad is Xbox or False if PlayStation
+
+# Period (in milliseconds) of looking for gamepads while none is connected
+# and while at least one gamepad is connected.
+gamepad_rescan_period = 200
+gamepad_hotplug_period = 1000
+gamepad_scan_time = 0 # time of the last scan for gamepads
+gamepad_disconnect_count = 0
+gamepad_ignored_count = 0 # events ignored because of a gamepad with higher priority
+
+# Optional control over the network: set "udp_control_port" to a port number to accept
+# control frames over UDP, for example from program "udp-control/send.py".
+# A frame (little-endian) has a sequence number, the send time of the sender in microseconds,
+# the left stick position (x, y) and the right trigger in the ranges of the Xbox gamepad
+# and a bitmask of pressed buttons, see "udp_button_codes". The frames are converted
+# to gamepad events of an Xbox gamepad and handled like them, including custom bindings.
+# Frames arriving out of order are dropped. If no frame arrives for "udp_control_timeout"
+# milliseconds, the stick is centered and the next frame starts a new sequence.
+udp_control_port = None
+udp_control_priority = 0
+udp_control_timeout = 500
+udp_frame_format = '<IIHHHH'
+udp_frame_size = struct.calcsize(udp_frame_format)
+udp_wait_buffer = bytearray(0) # for waiting for datagrams without reading them
+udp_axis_codes = (0, 1, 9) # left stick x, y, right trigger
+udp_button_codes = (304, 305, 307, 308, 310, 311, 158, 315, 317, 318) # A B X Y LB RB Back Start LS RS
+udp_gamepad = None # network control source, see class "Gamepad"
+udp_axis_state = array('i', [32767, 32767, 0]) # last axis values, centered
+udp_frame_axes = array('i', [32767, 32767, 0])
+udp_button_state = 0
+udp_active = False # frames arrive, the stick isn't centered by the timeout
+udp_sequence = 0 # sequence number of the last frame
+udp_send_time = 0 # send time of the last frame (microseconds, sender clock)
+udp_receive_time = 0 # receive time of the last frame (microseconds)
+# Statistics: frames, lost frames (gaps in sequence numbers), frames out of order,
+# invalid frames, timeouts and the jitter of the transit time (RFC 3550, in 1/16 us) and its maximum
+udp_frame_count = 0
+udp_lost_count = 0
+udp_out_of_order_count = 0
+udp_invalid_count = 0
+udp_timeout_count = 0
+udp_jitter = 0
+udp_jitter_max = 0
+
+# Constants for gamepad event types.
+ev_syn = 0 # end of event frame (code 0) and other sync events
+ev_key = 1 # button
+ev_abs = 3 # axis
+
+# Default bindings of gamepad events to actions for each gamepad type:
+# (event type, event code, action name). Actions are listed in "gamepad_actions".
+default_bindings = {
+    gamepad_xbox: (
+        (ev_abs, 0, "steering"), # Left Stick Horz. Axis
+        (ev_abs, 1, "throttle"), # Left Stick Vert. Axis
+        (ev_abs, 9, "bump"), # Right Trigger
+        (ev_key, 311, "gear_up"), # RB
+        (ev_key, 310, "gear_down"), # LB
+        (ev_key, 304, "gearbox_mode"), # A
+        (ev_key, 305, "motors"), # B
+        (ev_key, 307, "horn"), # X
+        (ev_key, 308, "sound_effect"), # Y
+        (ev_key, 158, "latency_report"), # Back
+        (ev_key, 315, "calibrate"), # Start
+        (ev_key, 318, "telemetry_dump")), # Right Stick press
+    gamepad_ps: (
+        (ev_abs, 0, "steering"), # Left Stick Horz. Axis
+        (ev_abs, 1, "throttle"), # Left Stick Vert. Axis
+        (ev_abs, 5, "bump"), # R2 paddle
+        (ev_key, 311, "gear_up"), # R1
+        (ev_key, 310, "gear_down"), # L1
+        (ev_key, 304, "gearbox_mode"), # X
+        (ev_key, 305, "motors"), # O
+        (ev_key, 307, "horn"), # /\
+        (ev_key, 308, "sound_effect"), # []
+        (ev_key, 314, "latency_report"), # Select
+        (ev_key, 315, "calibrate"), # Start
+        (ev_key, 318, "telemetry_dump"))} # R3
+
+# Optional file with custom bindings, overriding the default bindings.
+# Each line has the format "<xbox|ps> <event type> <event code> <action|none>",
+# for example "xbox 1 307 sound_effect". Use program "xbox-info" to find event codes.
+bindings_file = "bindings.txt"
+
+# Each gamepad has a dispatch table mapping gamepad events to handler functions,
+# compiled once the gamepad type is known. The keys are (event type << 16 | event code),
+# an integer key doesn't need any memory allocation for the lookup.
+
+# Default axis ranges (minimum, maximum, fuzz, flat) of sticks and triggers
+# used when the ranges can't be queried from the gamepad.
+default_stick_range = {gamepad_xbox: (0, 65535, 0, 0), gamepad_ps: (0, 255, 0, 0)}
+default_trigger_range = {gamepad_xbox: (0, 1023, 0, 0), gamepad_ps: (0, 255, 0, 0)}
+
+# Lookup tables for stick values with minimum values of the axes and the bit shifts
+# for quantizing stick values, built once the gamepad ranges are known.
+# Each gamepad has its own tables, they're selected before processing its events.
+stick_x_table = None
+stick_x_min = 0
+stick_x_shift = 0
+stick_y_table = None
+stick_y_min = 0
+stick_y_shift = 0
+
+# Minimum value and size of range of the right trigger (paddle).
+trigger_min = 0
+trigger_range = 1
 
 # Constants for gearbox mode.
 gearbox_manual = 1
@@ -94,29 +240,122 @@ automatic_comfort_gearbox = (
     (870, 90, 600, 1.0, 50, 450, 0.3, 0.8, 1.0, 1.2, 0.3), # Gear 3, 1:3 ratio
     (820, 110, 10000, 1.0, 50, 450, 0.3, 0, 0, 1.2, 0.3)) # Gear 4, 1:5 ratio
 
+# Power factors (power bump and power compensation) are fixed-point integers with "fixed_shift"
+# fractional bits, "fixed_one" stands for 1.0. On MicroPython each float result is a new object
+# on the heap, integer math doesn't allocate memory.
+fixed_shift = 10
+fixed_one = 1 << fixed_shift
+
 # Assuming sticks are in the middle and triggers are not pressed when starting
 gear = 1 # Current gear (1..4)
 power_pos = 0 # Current motor power (controlled by Y-axis of gamepad left stick) (-100..100)
-power_bump = 0 # Power bump (controller by right trigger)
-power_compensation = 1.0 # Power compensation after switching gears in comfort automatic mode
+power_bump = 0 # Power bump (controller by right trigger) (0..fixed_one)
+power_compensation = fixed_one # Power compensation after switching gears in comfort automatic mode
 steering_pos = 0 # Steering position (-100..100)
 motors = 2 # Use two motors
 
 # An events read from the virtual device file consists of the following elements:
-# long int, long int, unsigned short, unsigned short, long int
-gamepad_event_format = 'llHHl'
+# long int, long int, unsigned short, unsigned short, int
+# (the value is a 32-bit int, the same as long int on the EV3 brick)
+gamepad_event_format = 'llHHi'
 gamepad_event_size = struct.calcsize(gamepad_event_format)
 
+# Maximum number of events read from the device file at once.
+# When the program falls behind, one read takes a larger part of the backlog.
+gamepad_event_batch = 64
+
+# Events are read into a preallocated buffer and decoded in place,
+# so no memory is allocated per event.
+gamepad_event_buffer = bytearray(gamepad_event_size * gamepad_event_batch)
+gamepad_type_offset = struct.calcsize('ll')
+gamepad_code_offset = gamepad_type_offset + 2
+gamepad_value_offset = gamepad_type_offset + 4
+gamepad_usec_offset = struct.calcsize('l')
+
+# Axis values of the current event frame, None if the axis didn't change.
+# The gamepad sends a SYN_REPORT event after each frame (set of simultaneous changes).
+axis_steering = 0
+axis_power = 1
+axis_bump = 2
+frame_axes = [None, None, None]
+
+# Backlog policy: when the program was busy and events queued up, an event frame whose
+# kernel timestamp is older than "gamepad_stale_age" milliseconds isn't applied if newer events
+# follow in the same read. Its axis values stay collected and are superseded by the newer
+# values, so the motors follow the latest position of the sticks instead of replaying
+# the backlog. Button events are always processed.
+gamepad_stale_age = 100
+frame_stale = False # the collected axis values belong to a stale frame
+
+# Event statistics: events read, axis events merged into a newer value
+# of the same frame, axis events of stale frames superseded by a newer value,
+# frames applied to the motors.
+gamepad_event_count = 0
+gamepad_merged_count = 0
+gamepad_stale_count = 0
+gamepad_frame_count = 0
+
+# Opt-in measurement of the latency from the kernel timestamp of a gamepad event frame
+# to the motor command applying it. Results are collected in a histogram with 1 ms buckets,
+# the last bucket collects all larger latencies. The report is shown on the brick display
+# and written to "latency_file" when action "latency_report" is triggered and at exit.
+latency_probe = False
+latency_file = "latency.txt"
+latency_histogram = array('I', [0] * 101)
+latency_max = 0 # maximum latency in microseconds
+frame_event_time = 0 # timestamp of the frame being applied (seconds), 0 outside of "apply_frame"
+
+def record_latency(event_time):
+    """
+    Adds the time elapsed since the kernel timestamp of an event frame
+    to the latency histogram, called when a motor command is written to the motor.
+    """
+    global latency_max
+    latency = int((time.time() - event_time) * 1000000)
+    if latency > latency_max:
+        latency_max = latency
+    latency_histogram[max(0, min(latency // 1000, len(latency_histogram) - 1))] += 1
+
+# Opt-in telemetry for tuning: a periodic task records samples of the vehicle state into
+# a ring buffer. The fields (time in ms since start, gear, power_pos, steering_pos,
+# speed of the first motor, power_bump and power_compensation as fixed-point numbers)
+# are integers stored in a preallocated array, so recording a sample allocates no memory.
+# The buffer is written to "telemetry_file" when action "telemetry_dump" is triggered
+# and at exit. Each dump is appended as a block (header and samples, oldest first)
+# and empties the buffer. Program "telemetry-decoder/decode.py" converts the file to CSV.
+telemetry_enabled = False
+telemetry_file = "telemetry.bin"
+telemetry_samples = 1000
+telemetry_period = 20 # milliseconds
+telemetry_int_fields = 7
+telemetry_ints = array('i', [0] * (telemetry_samples * telemetry_int_fields))
+telemetry_index = 0 # position of the next sample in the ring buffer
+telemetry_count = 0 # number of samples in the ring buffer
+telemetry_dump_count = 0
+telemetry_start_time = utime.ticks_ms()
+# Block header: magic, number of fields, period in ms, number of samples
+telemetry_header_format = '<4sBHI'
+
+# Minimum change of motor power (in percent) and of steering angle (in degrees)
+# sent to the motors and minimum time (in milliseconds) between two commands
+# sent to a driving or steering motor, see class "CachedMotor".
+motor_dc_epsilon = 1
+motor_angle_epsilon = 1
+motor_command_interval = 10
+
 # Clear program title.
 brick.display.clear()
 brick.display.text("Rov3r+", (60, 20))
 
 # Declare motors and check their connections.
 try:
-    first_motor = Motor(Port.A, Direction.COUNTERCLOCKWISE)
-    second_motor = Motor(Port.D, Direction.COUNTERCLOCKWISE)
-    steering_motor = Motor(Port.B)
-    gearbox_motor = Motor(Port.C)
+    first_motor = CachedMotor(Motor(Port.A, Direction.COUNTERCLOCKWISE),
+        motor_dc_epsilon, motor_command_interval, record_latency)
+    second_motor = CachedMotor(Motor(Port.D, Direction.COUNTERCLOCKWISE),
+        motor_dc_epsilon, motor_command_interval, record_latency)
+    steering_motor = CachedMotor(Motor(Port.B), motor_angle_epsilon, motor_command_interval,
+        record_latency)
+    gearbox_motor = CachedMotor(Motor(Port.C), motor_angle_epsilon)
     second_motor.stop(Stop.COAST)
 except:
     brick.display.text("Check motor cables", (0, 80))
@@ -124,15 +363,24 @@ except:
     time.sleep(10)
     sys.exit(1)
 
-def find_gamepad():
+def find_gamepads():
     """
     Checks device list by reading content of virtual file "/proc/bus/input/devices"
-    looking for gamepad device.
+    looking for gamepad devices.
+    Returns list of tuples (device, gamepad type, priority).
     """
-    global gamepad_type
+    found = []
+    gamepad_type = 0
+    identity = "" # name, physical address and unique id of the device
     with open("/proc/bus/input/devices", "r") as fp:
         line = fp.readline()
         while line:
+            if line.startswith("I:"):
+                # Next device
+                gamepad_type = 0
+                identity = ""
+            if line.startswith("N: Name=") or line.startswith("P: Phys=") or line.startswith("U: Uniq="):
+                identity += line
             if enable_xbox_detection and line.startswith("N: Name=") and line.find("Xbox") > -1:
                 gamepad_type = gamepad_xbox
             if enable_ps_detection and line.startswith("N: Name=") and line.find("PLAYSTATION") > -1 and line.find("Motion") == -1:
@@ -141,34 +389,211 @@ def find_gamepad():
                 line = line[len("H: Handlers="):]
                 pb = line.find("event")
                 pe = line.find(" ", pb)
-                return line[pb:pe]
+                found.append((line[pb:pe], gamepad_type, gamepad_priority(identity)))
+                gamepad_type = 0
             line = fp.readline()
-    return None
+    return found
 
-def transform_stick(value):
+def gamepad_priority(identity):
     """
-    Transforms range 0..max to -100..100, removes deadzone from the range.
+    Returns the priority of the gamepad with the given identity, see "gamepad_priorities".
     """
-    max = 65535 if xbox else 255
-    half = int((max + 1) / 2)
-    deadzone = int((max + 1) / 100 * stick_deadzone)
-    value -= half
-    if abs(value) < deadzone:
-        value = 0
+    for (text, priority) in gamepad_priorities:
+        if identity.find(text) > -1:
+            return priority
+    return 0
+
+def decode_u16(buffer, pos):
+    """
+    Decodes unsigned short (little-endian) at the given position of the buffer.
+    """
+    return buffer[pos] | (buffer[pos + 1] << 8)
+
+def decode_s32(buffer, pos):
+    """
+    Decodes signed 32-bit integer (little-endian) at the given position of the buffer.
+    """
+    value = buffer[pos] | (buffer[pos + 1] << 8) | (buffer[pos + 2] << 16)
+    if buffer[pos + 3] & 0x80:
+        return value + ((buffer[pos + 3] - 256) << 24)
+    return value + (buffer[pos + 3] << 24)
+
+def read_axis_range(device_file, axis, default):
+    """
+    Queries range of a gamepad axis via ioctl EVIOCGABS.
+    Returns tuple (minimum, maximum, fuzz, flat) or the default if the gamepad can't be queried.
+    """
+    # struct input_absinfo: value, minimum, maximum, fuzz, flat, resolution
+    absinfo = bytearray(24)
+    request = 0x80184540 + axis # EVIOCGABS(axis)
+    try:
+        try:
+            import fcntl
+            fcntl.ioctl(device_file.fileno(), request, absinfo)
+        except ImportError:
+            # MicroPython has no module "fcntl", call ioctl from the C library directly
+            import ffi
+            ioctl = ffi.open("libc.so.6").func("i", "ioctl", "iLp")
+            if ioctl(device_file.fileno(), request, absinfo) != 0:
+                return default
+    except (ImportError, OSError):
+        return default
+    (value, minimum, maximum, fuzz, flat, resolution) = struct.unpack('6i', absinfo)
+    if maximum <= minimum:
+        return default
+    return (minimum, maximum, fuzz, flat)
+
+def set_nonblocking(device_file):
+    """
+    Switches the opened device file to non-blocking mode. On MicroPython a blocking read
+    waits until the whole buffer is filled, a non-blocking read returns the pending events
+    at once (None if there are none).
+    """
+    try:
+        import os
+        os.set_blocking(device_file.fileno(), False)
+    except (ImportError, AttributeError):
+        # MicroPython has no "os.set_blocking", call fcntl from the C library directly
+        import ffi
+        fcntl = ffi.open("libc.so.6").func("i", "fcntl", "iii")
+        flags = fcntl(device_file.fileno(), 3, 0) # F_GETFL
+        fcntl(device_file.fileno(), 4, flags | 0x800) # F_SETFL, O_NONBLOCK
+
+def transform_stick(value, minimum, maximum, flat):
+    """
+    Transforms range minimum..maximum to -100..100, removes deadzone from the range.
+    The deadzone is the larger one of "stick_deadzone" and the flat zone of the axis.
+    Integer math, the result is rounded to the nearest integer.
+    """
+    half = (maximum - minimum + 1) // 2
+    deadzone = max((maximum - minimum + 1) * stick_deadzone // 100, flat)
+    value -= minimum + half
+    if abs(value) <= deadzone:
+        return 0
     elif value > 0:
-        value = (value - deadzone - 1) / (half - deadzone) * 100
+        return ((value - deadzone - 1) * 200 + half - deadzone) // (2 * (half - deadzone))
     else:
-        value = (value + deadzone) / (half - deadzone) * 100
-    return value
+        return -(((-value - deadzone) * 200 + half - deadzone) // (2 * (half - deadzone)))
+
+def build_stick_table(axis_range):
+    """
+    Builds lookup table for transforming stick values from the axis range to -100..100.
+    Sticks with more than 256 positions are quantized to 256 table entries.
+    Returns the table and the bit shift to apply to the stick value (minus axis minimum)
+    before the lookup.
+    """
+    (minimum, maximum, fuzz, flat) = axis_range
+    shift = 0
+    while ((maximum - minimum) >> shift) > 255:
+        shift += 1
+    table = array('b', bytes(((maximum - minimum) >> shift) + 1))
+    for index in range(len(table)):
+        # Use the middle of the quantization step as representative value
+        value = minimum + (index << shift) + ((1 << shift) >> 1)
+        table[index] = transform_stick(min(value, maximum), minimum, maximum, flat)
+    return (table, shift)
+
+def probe_gamepad(device_file, bindings, gamepad_type):
+    """
+    Queries ranges of the gamepad axes bound to steering, throttle and bump
+    and builds lookup tables for them.
+    Returns the tables as tuple, see function "select_gamepad".
+    """
+    stick_x_table = stick_y_table = None
+    stick_x_min = stick_x_shift = stick_y_min = stick_y_shift = trigger_min = 0
+    trigger_range = 1
+
+    for key in bindings:
+        action = bindings[key]
+        code = key & 0xFFFF
+        if action == "steering":
+            stick_range = read_axis_range(device_file, code, default_stick_range[gamepad_type])
+            (stick_x_table, stick_x_shift) = build_stick_table(stick_range)
+            stick_x_min = stick_range[0]
+        elif action == "throttle":
+            stick_range = read_axis_range(device_file, code, default_stick_range[gamepad_type])
+            (stick_y_table, stick_y_shift) = build_stick_table(stick_range)
+            stick_y_min = stick_range[0]
+        elif action == "bump":
+            (trigger_min, maximum, fuzz, flat) = read_axis_range(device_file, code, default_trigger_range[gamepad_type])
+            trigger_range = maximum - trigger_min + 1
+
+    return (stick_x_table, stick_x_min, stick_x_shift, stick_y_table, stick_y_min, stick_y_shift,
+        trigger_min, trigger_range)
+
+class Gamepad:
+    """
+    Connected gamepad: device file, dispatch table and lookup tables of the axes.
+    """
+    def __init__(self, infile, device, gamepad_type, priority):
+        self.infile = infile
+        self.device = device # None for a file given on the command line
+        self.type = gamepad_type
+        self.priority = priority
+        self.event_time = None # time of the last events (milliseconds)
+        bindings = load_bindings(gamepad_type)
+        self.axes = probe_gamepad(infile, bindings, gamepad_type)
+        self.dispatch = compile_bindings(bindings)
+
+def select_gamepad(gamepad):
+    """
+    Selects lookup tables of the gamepad for processing its events.
+    """
+    global current_gamepad
+    global stick_x_table, stick_x_min, stick_x_shift
+    global stick_y_table, stick_y_min, stick_y_shift
+    global trigger_min, trigger_range
+    current_gamepad = gamepad
+    (stick_x_table, stick_x_min, stick_x_shift, stick_y_table, stick_y_min, stick_y_shift,
+        trigger_min, trigger_range) = gamepad.axes
+
+# Sound requests (function, argument) waiting to be played by the sound thread.
+# The queue is short, so that the sounds always follow the actions of the driver.
+sound_queue_size = 2
+sound_queue = []
+sound_lock = _thread.allocate_lock()
+sound_dropped_count = 0 # number of requests dropped because the queue was full
+
+# Period (in milliseconds) of checking the queue when there are no sound requests.
+sound_idle_period = 20
+
+def queue_sound(function, argument):
+    """
+    Queues a sound request for the sound thread: function "function" of "brick.sound"
+    is called with "argument". If the queue is full the oldest request is dropped.
+    """
+    global sound_dropped_count
+    sound_lock.acquire()
+    if len(sound_queue) >= sound_queue_size:
+        sound_queue.pop(0)
+        sound_dropped_count += 1
+    sound_queue.append((function, argument))
+    sound_lock.release()
+
+def sound_thread():
+    """
+    Plays queued sounds. Runs in a background thread, so that playing sounds
+    never blocks processing of gamepad events.
+    """
+    while True:
+        request = None
+        sound_lock.acquire()
+        if len(sound_queue) > 0:
+            request = sound_queue.pop(0)
+        sound_lock.release()
+        if request is None:
+            utime.sleep_ms(sound_idle_period)
+        else:
+            request[0](request[1])
 
 def play_horn():
     """
     Plays a horn sound randomly selected from two available sounds.
     """
     if random.randint(1, 2) == 1:
-        brick.sound.file(SoundFile.HORN_1)
+        queue_sound(brick.sound.file, SoundFile.HORN_1)
     else:
-        brick.sound.file(SoundFile.HORN_2)
+        queue_sound(brick.sound.file, SoundFile.HORN_2)
 
 def play_sound_effect():
     """
@@ -176,56 +601,327 @@ def play_sound_effect():
     """
     effect = random.randint(1, 4)
     if effect == 1:
-        brick.sound.file(SoundFile.AIR_RELEASE)
+        queue_sound(brick.sound.file, SoundFile.AIR_RELEASE)
     elif effect == 2:
-        brick.sound.file(SoundFile.AIRBRAKE)
+        queue_sound(brick.sound.file, SoundFile.AIRBRAKE)
     elif effect == 3:
-        brick.sound.file(SoundFile.LASER)
+        queue_sound(brick.sound.file, SoundFile.LASER)
     elif effect == 4:
-        brick.sound.file(SoundFile.SONAR)
+        queue_sound(brick.sound.file, SoundFile.SONAR)
 
 def calibrate_motors():
     """
     Calibrates gearbox motor: switches to first gear.
     Calibrates steering motor: finds the range by steering full to the left
     and full to the right, then centers the steering.
+    Saves the results to the calibration file.
     """
     global max_steering_angle
 
     gearbox_motor.run_until_stalled(360, Stop.COAST, 50)
-    gearbox_motor.run_angle(100, -20) # unstress the switcher
+    gearbox_motor.run_angle(100, gearbox_zero_offset) # unstress the switcher
     gearbox_motor.reset_angle(0)
 
     steering_motor.run_until_stalled(720, Stop.COAST, 80)
     steering_motor.reset_angle(0)
     steering_motor.run_until_stalled(-720, Stop.COAST, 80)
-    max_steering_angle = abs(steering_motor.angle()) / 2
+    max_steering_angle = abs(steering_motor.angle()) // 2
     steering_motor.run_target(720, -max_steering_angle)
     steering_motor.reset_angle(0)
-    max_steering_angle *= 0.90  # limit max steering angle a little
+    max_steering_angle = int(max_steering_angle * steering_limit)  # limit max steering angle a little
+
+    save_calibration()
+
+def save_calibration():
+    """
+    Writes calibration results to the calibration file.
+    """
+    try:
+        with open(calibration_file, "w") as fp:
+            fp.write("max_steering_angle " + str(max_steering_angle) + "\n")
+            fp.write("gearbox_zero_offset " + str(gearbox_zero_offset) + "\n")
+    except OSError:
+        pass # the calibration is repeated on the next start
+
+def load_calibration():
+    """
+    Reads calibration results from the calibration file.
+    Returns False if the file doesn't exist or is incomplete.
+    """
+    global max_steering_angle, gearbox_zero_offset
+    values = {}
+    try:
+        with open(calibration_file, "r") as fp:
+            for line in fp:
+                fields = line.split()
+                if len(fields) == 2:
+                    values[fields[0]] = float(fields[1])
+    except (OSError, ValueError):
+        return False
+    if "max_steering_angle" not in values or "gearbox_zero_offset" not in values:
+        return False
+    max_steering_angle = int(values["max_steering_angle"])
+    gearbox_zero_offset = values["gearbox_zero_offset"]
+    return True
+
+def verify_calibration():
+    """
+    Checks the loaded calibration by moving gearbox and steering motors to one end stop
+    at low power. The motors are expected in the first gear and in the center position,
+    where they were left at exit. Then switches to first gear and centers the steering.
+    Returns False if an end stop wasn't found at the expected distance.
+    """
+    start = gearbox_motor.angle()
+    gearbox_motor.run_until_stalled(360, Stop.COAST, calibration_power)
+    travel = gearbox_motor.angle() - start
+    if abs(travel + gearbox_zero_offset) > gearbox_calibration_tolerance:
+        return False
+    gearbox_motor.run_angle(100, gearbox_zero_offset) # unstress the switcher
+    gearbox_motor.reset_angle(0)
+
+    steering_stop_angle = max_steering_angle / steering_limit
+    start = steering_motor.angle()
+    steering_motor.run_until_stalled(720, Stop.COAST, calibration_power)
+    travel = steering_motor.angle() - start
+    if abs(travel - steering_stop_angle) > steering_calibration_tolerance:
+        return False
+    steering_motor.reset_angle(steering_stop_angle)
+    steering_motor.run_target(720, 0)
+    return True
+
+def park_motors():
+    """
+    Stops driving motors, centers the steering and switches to first gear,
+    the positions expected by the calibration check on the next start.
+    """
+    first_motor.stop(Stop.COAST)
+    second_motor.stop(Stop.COAST)
+    steering_motor.run_target(720, 0)
+    gearbox_motor.run_target(100, 0)
+
+def recalibrate():
+    """
+    Stops the vehicle and repeats the full calibration of the motors.
+    """
+    global gear, steering_pos
+    drive(0, None, None)
+    calibrate_motors()
+    # The calibration leaves the steering centered in first gear.
+    steering_pos = 0
+    gear = 1
+    reset_automatic_gearbox()
+
+# Retained model of the display: lines of text by vertical position, {y: (x, text)}.
+# Functions change lines of the model, the display task brings the display up to date
+# after the motor commands, drawing only the lines which changed.
+# Text is drawn with a transparent background, so a changed line must be erased first.
+# The display of LEGO MicroPython 1.0 can't erase a part of the screen, there changing
+# a line clears the display and draws all lines again, as does replacing all lines.
+# Because that is slow and runs in the same loop as the input, a redraw for changed lines
+# (like the status line) is postponed while the vehicle is driving and done after it stops,
+# checking every "display_idle_check_period" milliseconds. New lines are just drawn.
+display_lines = {}
+display_shown = None # lines on the display, None if unknown (drawn directly)
+display_ready = uasyncio.Event()
+display_task_time = 0 # CPU time of the display task in microseconds
+display_line_count = 0 # number of lines drawn
+display_clear_count = 0 # number of times the display was cleared
+display_width = 178
+display_line_height = 10
+display_can_erase = hasattr(brick.display, "draw_box")
+display_idle_check_period = 200
+display_postponed_count = 0 # number of times a redraw was postponed
+
+# Status line (gear, motor power and speed in degrees per second) at the bottom of the help screen,
+# refreshed with low rate (in milliseconds) by a periodic task.
+status_line_position = 115
+status_refresh_period = 500
+
+def display_line(y, text, x=0):
+    """
+    Sets the line of the display model at vertical position "y", text None removes the line.
+    Wakes the display task if the model changed.
+    """
+    line = None if text is None else (x, text)
+    if display_lines.get(y) != line:
+        if line is None:
+            del display_lines[y]
+        else:
+            display_lines[y] = line
+        display_ready.set()
+
+def clear_display_lines():
+    """
+    Removes all lines from the display model.
+    """
+    for y in list(display_lines):
+        display_line(y, None)
+
+def update_display(force=False):
+    """
+    Brings the display up to date with the display model.
+    Returns False if a redraw of the whole display was postponed because the vehicle
+    is driving, see "display_idle_check_period". "force" redraws anyway.
+    """
+    global display_shown, display_line_count, display_clear_count, display_postponed_count
+    if display_shown is None:
+        changed = True
+    else:
+        changed = [y for y in display_shown if display_lines.get(y) != display_shown[y]]
+    if changed and (display_shown is None or not display_can_erase or
+            len(changed) == len(display_shown)):
+        if (not force and display_shown is not None and len(changed) < len(display_shown) and
+                (power_pos or steering_pos)):
+            display_postponed_count += 1
+            return False
+        brick.display.clear()
+        display_clear_count += 1
+        display_shown = {}
+    elif changed:
+        for y in changed:
+            brick.display.draw_box(0, y, display_width - 1, y + display_line_height - 1,
+                fill=True, color=Color.WHITE)
+            del display_shown[y]
+    for y in display_lines:
+        if display_shown.get(y) != display_lines[y]:
+            (x, text) = display_lines[y]
+            brick.display.text(text, (x, y))
+            display_shown[y] = display_lines[y]
+            display_line_count += 1
+    return True
+
+async def display_task():
+    """
+    Task updating the display when the display model changes.
+    """
+    global display_task_time
+    while True:
+        await display_ready.wait()
+        display_ready.clear()
+        start = utime.ticks_us()
+        updated = update_display()
+        display_task_time += utime.ticks_diff(utime.ticks_us(), start)
+        if not updated:
+            # Try again later, unless the model changes before
+            await uasyncio.sleep_ms(display_idle_check_period)
+            display_ready.set()
+
+def status_line_task():
+    """
+    Periodic task updating the status line of the help screen.
+    The display task draws it only if the text changed.
+    """
+    if status_line_position in display_lines:
+        display_line(status_line_position, "Gear %d %d%% %d dps" % (gear,
+            propulsion_power(), first_motor.speed()))
 
 def print_help():
     """
     Prints program info and gamepad mapping to the brick display.
-    Also prints current gearbox mode in the status line.
-    """
-    brick.display.clear()
-    brick.display.text("Rov3r+", (60, 10))
-    brick.display.text(("Xbox" if xbox else "PS") + " gamepad functions:", (0, 30))
-    brick.display.text("Left Stick: movement", (0, 45))
-    brick.display.text(("RB/LB" if xbox else "R1/L1") + ": gear up/down", (0, 55))
-    brick.display.text(("A" if xbox else "X") + ": auto comfort/sport", (0, 65))
-    brick.display.text(("B" if xbox else "O") + ": one/two motors", (0, 75))
-    brick.display.text(("RT" if xbox else "R2") + ": steer. speed bump", (0, 85))
-    brick.display.text(("X" if xbox else "/\\") + ": horn", (0, 95))
-    brick.display.text(("Y" if xbox else "[]") + ": sound effect", (0, 105))
-    brick.display.text((("manual" if gearbox_mode == gearbox_manual
+    Also prints current gearbox mode and the status line.
+    """
+    clear_display_lines()
+    display_line(10, "Rov3r+", 60)
+    display_line(30, ("Xbox" if xbox else "PS") + " gamepad functions:")
+    display_line(45, "Left Stick: movement")
+    display_line(55, ("RB/LB" if xbox else "R1/L1") + ": gear up/down")
+    display_line(65, ("A" if xbox else "X") + ": auto comfort/sport")
+    display_line(75, ("B" if xbox else "O") + ": one/two motors")
+    display_line(85, ("RT" if xbox else "R2") + ": steer. speed bump")
+    display_line(95, ("X" if xbox else "/\\") + ": horn")
+    display_line(105, ("Y" if xbox else "[]") + ": sound effect")
+    display_line(status_line_position, "")
+    status_line_task()
+    display_line(125, (("manual" if gearbox_mode == gearbox_manual
         else "auto comfort" if gearbox_mode == gearbox_auto_comfort else "auto sport")) +
-        ", " + str(motors) + " motor" + ("s" if motors > 1 else ""), (0, 125))
+        ", " + str(motors) + " motor" + ("s" if motors > 1 else ""))
+
+def latency_percentile(percent):
+    """
+    Returns the latency (in ms) below which "percent" of measured latencies lie.
+    """
+    count = sum(latency_histogram)
+    limit = count * percent / 100
+    total = 0
+    for bucket in range(len(latency_histogram)):
+        total += latency_histogram[bucket]
+        if total >= limit:
+            return bucket + 1
+    return len(latency_histogram)
+
+def report_latency():
+    """
+    Shows latency statistics on the brick display and writes them to the latency file.
+    """
+    if not latency_probe:
+        return
+    lines = ["Latency, %d samples:" % sum(latency_histogram),
+        "p50: < %d ms" % latency_percentile(50),
+        "p95: < %d ms" % latency_percentile(95),
+        "p99: < %d ms" % latency_percentile(99),
+        "max: %.1f ms" % (latency_max / 1000)]
+    clear_display_lines()
+    for index in range(len(lines)):
+        display_line(20 + index * 15, lines[index])
+    with open(latency_file, "w") as fp:
+        for line in lines:
+            fp.write(line + "\n")
+        fp.write("Histogram (ms: count):\n")
+        for bucket in range(len(latency_histogram)):
+            if latency_histogram[bucket] > 0:
+                fp.write("%d: %d\n" % (bucket, latency_histogram[bucket]))
+
+def telemetry_task():
+    """
+    Periodic task recording a sample of the vehicle state into the telemetry ring buffer.
+    """
+    global telemetry_index, telemetry_count
+    pos = telemetry_index * telemetry_int_fields
+    telemetry_ints[pos] = utime.ticks_diff(utime.ticks_ms(), telemetry_start_time)
+    telemetry_ints[pos + 1] = gear
+    telemetry_ints[pos + 2] = power_pos
+    telemetry_ints[pos + 3] = steering_pos
+    telemetry_ints[pos + 4] = first_motor.speed()
+    telemetry_ints[pos + 5] = power_bump
+    telemetry_ints[pos + 6] = power_compensation
+    telemetry_index += 1
+    if telemetry_index == telemetry_samples:
+        telemetry_index = 0
+    if telemetry_count < telemetry_samples:
+        telemetry_count += 1
+
+def dump_telemetry():
+    """
+    Appends the samples of the telemetry ring buffer to the telemetry file and empties the buffer.
+    The file is replaced by the first dump of the program.
+    """
+    global telemetry_index, telemetry_count, telemetry_dump_count
+    if not telemetry_enabled or telemetry_count == 0:
+        return
+    # The oldest sample is at the current position if the buffer is full, otherwise at the beginning
+    first = telemetry_index if telemetry_count == telemetry_samples else 0
+    ints = memoryview(telemetry_ints)
+    with open(telemetry_file, "ab" if telemetry_dump_count else "wb") as fp:
+        fp.write(struct.pack(telemetry_header_format, b"RTLM", telemetry_int_fields,
+            telemetry_period, telemetry_count))
+        fp.write(ints[first * telemetry_int_fields:telemetry_count * telemetry_int_fields])
+        fp.write(ints[:telemetry_index * telemetry_int_fields if first else 0])
+    telemetry_dump_count += 1
+    telemetry_index = 0
+    telemetry_count = 0
+
+def propulsion_power():
+    """
+    Returns power (duty cycle) of the driving motors: power_pos * (1 + power_bump) * power_compensation,
+    rounded to the nearest integer.
+    """
+    return (power_pos * (fixed_one + power_bump) * power_compensation +
+        (1 << (2 * fixed_shift - 1))) >> (2 * fixed_shift)
 
 def drive(_power_pos, _power_bump, _power_compensation):
     """
     Sets current power settings for driving motors.
+    Power bump and power compensation are fixed-point numbers (see "fixed_one").
     """
     global power_pos, power_bump, power_compensation
     if _power_pos == None:
@@ -239,12 +935,12 @@ def drive(_power_pos, _power_bump, _power_compensation):
         power_pos = _power_pos
         power_bump = _power_bump
         power_compensation = _power_compensation
-        propulsion_power = power_pos * (1 + power_bump) * power_compensation
-        first_motor.dc(propulsion_power)
+        power = propulsion_power()
+        first_motor.dc(power, frame_event_time)
         if motors == 2:
-            second_motor.dc(propulsion_power)
+            second_motor.dc(power, frame_event_time)
         else:
-            second_motor.stop(Stop.COAST)
+            second_motor.stop(Stop.COAST, frame_event_time)
 
 def steer(_steering_pos):
     """
@@ -254,8 +950,8 @@ def steer(_steering_pos):
     global steering_pos
     if steering_pos != _steering_pos:
         steering_pos = _steering_pos
-        steering_angle = - steering_pos * max_steering_angle / 100
-        steering_motor.track_target(steering_angle)
+        steering_angle = - steering_pos * max_steering_angle // 100
+        steering_motor.track_target(steering_angle, frame_event_time)
 
 def switch_gear(_gear):
     """
@@ -279,26 +975,65 @@ def select_gearbox_mode(mode):
         gearbox_mode = mode
         print_help()
         if gearbox_mode == gearbox_auto_comfort:
-            brick.sound.beeps(1)
+            queue_sound(brick.sound.beeps, 1)
         elif gearbox_mode == gearbox_auto_sport:
-            brick.sound.beeps(2)
+            queue_sound(brick.sound.beeps, 2)
         elif gearbox_mode == gearbox_manual:
-            brick.sound.beeps(3)
+            queue_sound(brick.sound.beeps, 3)
 
 def select_motors(motor_count):
     global motors
     if motors != motor_count:
         motors = motor_count
         print_help()
-        brick.sound.beeps(motors)
+        queue_sound(brick.sound.beeps, motors)
         # Start or stop second motor.
         # We increase current power a little so that function "drive" see some changes to process.
         drive(power_pos + 1, None, None)
 
+# Rate (in Hz) of the automatic gearbox control and of the power compensation
+# for the automatic comfort gearbox.
+gearbox_control_rate = 50
+gearbox_control_period = 1000 // gearbox_control_rate
+comfort_control_period = 1000 // gearbox_control_rate
+
+# Periodic tasks: [function, period, next execution time, executions, missed executions,
+# total lateness, maximum lateness, CPU time]. Times are in microseconds.
+# Tasks run at a fixed rate: each execution is due one period after the previous one
+# was due, no matter how late the previous one was. The input task handles one batch
+# of gamepad events before it waits again, so input can't starve the tasks.
+periodic_tasks = []
+
+# Garbage collection: automatic collections are disabled, so that a collection never
+# pauses the program in the middle of processing gamepad events or of a periodic task.
+# Task "gc_task" collects the memory in idle gaps instead: no input is pending and
+# the next periodic task isn't due before the collection ends (judging by the average
+# collection so far). It collects at most every "gc_idle_period" milliseconds and only
+# after at least "gc_idle_allocated" bytes were allocated since the last collection.
+# If free memory drops below "gc_min_free" bytes while input keeps coming,
+# the memory is collected right away after processing the input.
+gc_idle_period = 200
+gc_idle_allocated = 4096
+gc_min_free = 16384
+gc_check_period = 10 # milliseconds between checks for an idle gap
+gc_idle_count = 0 # number of collections in idle gaps
+gc_forced_count = 0 # number of collections because of low free memory
+gc_pause_total = 0 # time spent collecting in microseconds
+gc_pause_max = 0 # longest collection in microseconds
+gc_last_time = utime.ticks_ms() # time of the last collection
+gc_last_alloc = 0 # allocated memory after the last collection
+# Desktop Python has no "gc.mem_free" and "gc.mem_alloc", there the memory
+# is collected in idle gaps only and without looking at the allocated memory.
+gc_can_measure = hasattr(gc, "mem_free")
+# Gamepad device files and the UDP socket, for checking if input is pending.
+input_poll = uselect.poll()
+
 # Variables to hold state of the automatic gearbox.
+# Power compensation: start time (utime.ticks_ms, None if inactive), starting factor
+# (fixed-point) and duration in milliseconds.
 gear_up_time = 0
 gear_down_time = 0
-comfort_time = 0
+comfort_time = None
 comfort_factor = 0
 comfort_duration = 0
 
@@ -309,7 +1044,7 @@ def reset_automatic_gearbox():
     """    
     gear_up_time = 0
     gear_down_time = 0
-    power_compensation = 1.0
+    power_compensation = fixed_one
 
 def automatic_gearbox_control():
     """
@@ -320,7 +1055,8 @@ def automatic_gearbox_control():
     For automatic comfort gearbox: decreases motor power after gearing up or
     increases motor power after gearing down, to compensate for changed gear
     ratio in order to prevent jerky linear movement. The motor power is then
-    smoothly correctd back to its original value within 0.5-2 seconds.
+    smoothly correctd back to its original value within 0.5-2 seconds
+    (see function "comfort_compensation_control").
     """
     global gear_up_time, gear_down_time
     global comfort_time, comfort_factor, comfort_duration
@@ -336,7 +1072,7 @@ def automatic_gearbox_control():
     comfort = gearbox_mode == gearbox_auto_comfort
     gearbox = automatic_comfort_gearbox if comfort else automatic_sport_gearbox
     gear_data = gearbox[gear - 1]
-    power_compensation_in_progress = abs(power_compensation - 1.0) > 0.01
+    power_compensation_in_progress = abs(power_compensation - fixed_one) > fixed_one // 100
 
     # Can we gear up?
     if abs(power_pos) >= gear_data[1] and speed >= gear_data[2] and not power_compensation_in_progress:
@@ -347,9 +1083,9 @@ def automatic_gearbox_control():
             #print("Gear up to", gear + 1)
             switch_gear(gear + 1)
             if comfort:
-                comfort_time = current_time
-                comfort_factor = gear_data[7]
-                comfort_duration = gear_data[8]
+                comfort_time = utime.ticks_ms()
+                comfort_factor = int(gear_data[7] * fixed_one)
+                comfort_duration = int(gear_data[8] * 1000)
                 #print("Compensate drive power", comfort_factor, comfort_duration, comfort_time)
                 drive(None, None, comfort_factor)
             gear_up_time = 0
@@ -365,109 +1101,656 @@ def automatic_gearbox_control():
             #print("Gear down to", gear - 1)
             switch_gear(gear - 1)
             if comfort:
-                comfort_time = current_time
-                comfort_factor = gear_data[9]
-                comfort_duration = gear_data[10]
+                comfort_time = utime.ticks_ms()
+                comfort_factor = int(gear_data[9] * fixed_one)
+                comfort_duration = int(gear_data[10] * 1000)
                 #print("Compensate drive power", comfort_factor, comfort_duration, comfort_time)
                 drive(None, None, comfort_factor)
             gear_down_time = 0
     else:
         gear_down_time = 0
 
-    # Comfort gearbox: gradually adjust power factor compensation after switching to a higher gear
-    if comfort_time > 0 and current_time > comfort_time:
-        duration = current_time - comfort_time
+def comfort_compensation_control():
+    """
+    Comfort gearbox: gradually adjusts power factor compensation after switching gears.
+    This function is called very often (many times for second).
+    """
+    global comfort_time
+
+    if comfort_time is None:
+        return
+    duration = utime.ticks_diff(utime.ticks_ms(), comfort_time)
+    if duration > 0:
         if duration < comfort_duration:
-            if comfort_factor < 1.0:
-                # Gear up
-                compensation = comfort_factor + (1.0 - comfort_factor) * duration / comfort_duration
-            else:
-                # Gear down
-                compensation = comfort_factor - (comfort_factor - 1.0) * duration / comfort_duration
-            #print("Compensate drive power", compensation, comfort_factor, comfort_duration, comfort_time, current_time, duration)
+            # Linear ramp from the compensation factor (below 1.0 after gearing up,
+            # above 1.0 after gearing down) to 1.0
+            compensation = comfort_factor + (fixed_one - comfort_factor) * duration // comfort_duration
+            #print("Compensate drive power", compensation, comfort_factor, comfort_duration, comfort_time, duration)
         else:
             #print("Reset drive power")
-            compensation = 1.0
-            comfort_time = 0
+            compensation = fixed_one
+            comfort_time = None
         drive(None, None, compensation)
 
-def process_gamepad_event(device_file):
+def flush_motor_commands():
     """
-    Reads events from the gamepad device virtual file and processes them.
+    Periodic task sending motor commands delayed by the minimum time between commands.
     """
-    # Read from the gamepad device virtual file
-    event = device_file.read(gamepad_event_size)
+    first_motor.flush()
+    second_motor.flush()
+    steering_motor.flush()
 
-    (tv_sec, tv_usec, ev_type, code, value) = struct.unpack(gamepad_event_format, event)
+def gearbox_control_task():
+    """
+    Periodic task of the automatic gearbox, inactive in manual gearbox mode.
+    """
+    if gearbox_mode != gearbox_manual:
+        automatic_gearbox_control()
 
-    if ev_type == 3 or ev_type == 1:
+def schedule_task(function, period):
+    """
+    Adds a function to the list of periodic tasks executed every "period" milliseconds.
+    """
+    periodic_tasks.append([function, period * 1000, 0, 0, 0, 0, 0, 0])
 
-        if ev_type == 3 and code == 0: # Left Stick Horz. Axis
-            steer(transform_stick(value))
+async def periodic_task(task):
+    """
+    Task executing a function of the list of periodic tasks at a fixed rate.
+    """
+    task[2] = utime.ticks_add(utime.ticks_us(), task[1])
+    while True:
+        # The sleep has millisecond resolution and may end before the deadline,
+        # so sleep again until the deadline has passed
+        wait = utime.ticks_diff(task[2], utime.ticks_us())
+        while wait > 0:
+            await uasyncio.sleep_ms((wait + 999) // 1000)
+            wait = utime.ticks_diff(task[2], utime.ticks_us())
+        start = utime.ticks_us()
+        lateness = utime.ticks_diff(start, task[2])
+        task[0]()
+        task[3] += 1
+        task[5] += lateness
+        if lateness > task[6]:
+            task[6] = lateness
+        # Executions which are more than a period late are skipped.
+        missed = lateness // task[1]
+        task[4] += missed
+        task[2] = utime.ticks_add(task[2], (missed + 1) * task[1])
+        task[7] += utime.ticks_diff(utime.ticks_us(), start)
 
-        elif ev_type == 3 and code == 1: # Left Stick Vert. Axis
-            drive(-transform_stick(value), None, None)
+def collect_garbage(forced):
+    """
+    Collects garbage and records the length of the pause.
+    """
+    global gc_idle_count, gc_forced_count, gc_pause_total, gc_pause_max, gc_last_time, gc_last_alloc
+    start = utime.ticks_us()
+    gc.collect()
+    pause = utime.ticks_diff(utime.ticks_us(), start)
+    gc_pause_total += pause
+    if pause > gc_pause_max:
+        gc_pause_max = pause
+    if forced:
+        gc_forced_count += 1
+    else:
+        gc_idle_count += 1
+    gc_last_time = utime.ticks_ms()
+    if gc_can_measure:
+        gc_last_alloc = gc.mem_alloc()
 
-        elif xbox and ev_type == 3 and code == 9: # Xbox Right Trigger
-            drive(None, value / 1024, None)
+def check_free_memory():
+    """
+    Collects garbage right away if free memory is low.
+    """
+    if gc_can_measure and gc.mem_free() < gc_min_free:
+        collect_garbage(True)
+
+async def gc_task():
+    """
+    Task collecting garbage in idle gaps, see "gc_idle_period".
+    """
+    while True:
+        await uasyncio.sleep_ms(gc_check_period)
+        if (utime.ticks_diff(utime.ticks_ms(), gc_last_time) < gc_idle_period or
+                gc_can_measure and gc.mem_alloc() - gc_last_alloc < gc_idle_allocated or
+                input_poll.poll(0)):
+            continue
+        now = utime.ticks_us()
+        pause = gc_pause_total // max(gc_idle_count + gc_forced_count, 1)
+        idle = True
+        for task in periodic_tasks:
+            idle = idle and utime.ticks_diff(task[2], now) > pause
+        if idle:
+            collect_garbage(False)
+
+def report_gc():
+    """
+    Prints numbers of garbage collections and their pauses.
+    """
+    count = gc_idle_count + gc_forced_count
+    print("Garbage collections: idle:", gc_idle_count, ", forced:", gc_forced_count,
+        ", pause avg:", gc_pause_total // max(count, 1), "us, max:", gc_pause_max, "us")
+
+def report_tasks(elapsed):
+    """
+    Prints execution statistics of the tasks: CPU time (and its share of the elapsed time
+    in microseconds), for periodic tasks also missed deadlines and lateness (jitter).
+    """
+    for task in periodic_tasks:
+        print("Task", task[0].__name__, ": executions:", task[3], ", missed:", task[4],
+            ", lateness avg:", task[5] // max(task[3], 1), "us, max:", task[6], "us",
+            ", CPU: %.1f%%" % (task[7] * 100 / max(elapsed, 1)))
+    print("Task input: CPU: %.1f%%" % (input_task_time * 100 / max(elapsed, 1)))
+    print("Task display: CPU: %.1f%%" % (display_task_time * 100 / max(elapsed, 1)))
+
+def collect_axis(axis, value):
+    """
+    Stores the latest value of an axis for the current event frame.
+    An older value received within the same frame is overwritten (latest wins).
+    """
+    global gamepad_merged_count, gamepad_stale_count
+    if frame_axes[axis] is not None:
+        if frame_stale:
+            gamepad_stale_count += 1
+        else:
+            gamepad_merged_count += 1
+    frame_axes[axis] = value
 
-        elif not xbox and ev_type == 3 and code == 5: # PS R2 paddle
-            drive(None, value / 256, None)
+def apply_frame():
+    """
+    Applies the axis values collected since the last SYN_REPORT event to the motors.
+    """
+    global gamepad_frame_count, frame_event_time, frame_stale
+    gamepad_frame_count += 1
+    if frame_axes[axis_steering] is not None:
+        steer(frame_axes[axis_steering])
+    if frame_axes[axis_power] is not None or frame_axes[axis_bump] is not None:
+        drive(frame_axes[axis_power], frame_axes[axis_bump], None)
+    frame_axes[axis_steering] = None
+    frame_axes[axis_power] = None
+    frame_axes[axis_bump] = None
+    frame_event_time = 0
+    frame_stale = False
 
-        elif ev_type == 1 and code == 311 and value == 1: # RB pressed
-            switch_gear(min(gear + 1, 4))
-            select_gearbox_mode(gearbox_manual)
+# Handlers of gamepad events, called with the value of the event.
 
-        elif ev_type == 1 and code == 310 and value == 1: # LB pressed
-            switch_gear(max(gear - 1, 1))
-            select_gearbox_mode(gearbox_manual)
+def on_sync(value):
+    # End of the event frame (SYN_REPORT)
+    apply_frame()
 
-        elif ev_type == 1 and code == 304 and value == 1: # A pressed
-            select_gearbox_mode(gearbox_auto_comfort if gearbox_mode == gearbox_auto_sport else gearbox_auto_sport)
+def on_steering(value):
+    collect_axis(axis_steering, stick_x_table[(value - stick_x_min) >> stick_x_shift])
 
-        elif ev_type == 1 and code == 305 and value == 1: # B pressed
-            select_motors(2 if motors == 1 else 1)
+def on_throttle(value):
+    collect_axis(axis_power, -stick_y_table[(value - stick_y_min) >> stick_y_shift])
 
-        elif ev_type == 1 and code == 307 and value == 1: # X pressed
-            play_horn()
+def on_bump(value):
+    collect_axis(axis_bump, ((value - trigger_min) << fixed_shift) // trigger_range)
 
-        elif ev_type == 1 and code == 308 and value == 1: # Y pressed
-            play_sound_effect()
+def on_gear_up(value):
+    if value == 1:
+        switch_gear(min(gear + 1, 4))
+        select_gearbox_mode(gearbox_manual)
 
-# Find the gamepad
-gamepad_device = find_gamepad()
-xbox = gamepad_type == gamepad_xbox
-#print("Gamepad device:", gamepad_device, ", type:", gamepad_type)
+def on_gear_down(value):
+    if value == 1:
+        switch_gear(max(gear - 1, 1))
+        select_gearbox_mode(gearbox_manual)
 
-if gamepad_device is None:
-    brick.display.text("Gamepad not found", (0, 80))
-    brick.sound.file(SoundFile.ERROR_ALARM)
-    time.sleep(10)
-    sys.exit(1)
+def on_gearbox_mode(value):
+    if value == 1:
+        select_gearbox_mode(gearbox_auto_comfort if gearbox_mode == gearbox_auto_sport else gearbox_auto_sport)
+
+def on_motors(value):
+    if value == 1:
+        select_motors(2 if motors == 1 else 1)
+
+def on_horn(value):
+    if value == 1:
+        play_horn()
+
+def on_sound_effect(value):
+    if value == 1:
+        play_sound_effect()
+
+def on_latency_report(value):
+    if value == 1:
+        report_latency()
+
+def on_telemetry_dump(value):
+    if value == 1:
+        dump_telemetry()
+
+def on_calibrate(value):
+    global calibrate_press_time
+    if value == 1:
+        calibrate_press_time = utime.ticks_ms()
+    elif value == 0 and calibrate_press_time is not None:
+        if utime.ticks_diff(utime.ticks_ms(), calibrate_press_time) >= calibration_hold_time:
+            recalibrate()
+        calibrate_press_time = None
 
-gamepad_infile_path = "/dev/input/" + gamepad_device
-gamepad_infile = open(gamepad_infile_path, "rb")
+# Actions which can be bound to gamepad events.
+gamepad_actions = {
+    "steering": on_steering,
+    "throttle": on_throttle,
+    "bump": on_bump,
+    "gear_up": on_gear_up,
+    "gear_down": on_gear_down,
+    "gearbox_mode": on_gearbox_mode,
+    "motors": on_motors,
+    "horn": on_horn,
+    "sound_effect": on_sound_effect,
+    "latency_report": on_latency_report,
+    "telemetry_dump": on_telemetry_dump,
+    "calibrate": on_calibrate}
+
+def load_bindings(gamepad_type):
+    """
+    Returns bindings for the gamepad type as dictionary mapping
+    event keys (event type << 16 | event code) to action names.
+    Default bindings are overridden by the bindings file, if it exists.
+    """
+    bindings = {}
+    for (ev_type, code, action) in default_bindings[gamepad_type]:
+        bindings[(ev_type << 16) | code] = action
+    gamepad_name = "xbox" if gamepad_type == gamepad_xbox else "ps"
+    try:
+        with open(bindings_file, "r") as fp:
+            for line in fp:
+                fields = line.split("#")[0].split()
+                if len(fields) == 4 and fields[0] == gamepad_name:
+                    key = (int(fields[1]) << 16) | int(fields[2])
+                    if fields[3] == "none":
+                        bindings.pop(key, None)
+                    elif fields[3] in gamepad_actions:
+                        bindings[key] = fields[3]
+                    else:
+                        print("Unknown action in bindings file:", fields[3])
+    except OSError:
+        pass # no bindings file, use default bindings
+    return bindings
+
+def compile_bindings(bindings):
+    """
+    Builds dispatch table mapping event keys directly to the handler functions.
+    """
+    dispatch = {(ev_syn << 16) | 0: on_sync}
+    for key in bindings:
+        dispatch[key] = gamepad_actions[bindings[key]]
+    return dispatch
+
+def overrides(other, gamepad, now):
+    """
+    Returns True if the other gamepad has a higher priority than the gamepad and is in use.
+    """
+    return (other is not None and other.priority > gamepad.priority and
+        other.event_time is not None and
+        utime.ticks_diff(now, other.event_time) < gamepad_override_time)
+
+def process_gamepad_events(gamepad, size):
+    """
+    Processes events read from the gamepad device virtual file into the event buffer.
+    Axis events are collected until the end of the event frame (SYN_REPORT) and
+    then applied to the motors at once. Button events are processed immediately.
+    Events without bindings are dropped after one lookup in the dispatch table.
+    Events are ignored while a gamepad with higher priority is in use.
+    Stale frames followed by newer events aren't applied, see "gamepad_stale_age".
+    """
+    global gamepad_event_count, gamepad_ignored_count, frame_event_time, frame_stale
+
+    now = utime.ticks_ms()
+    gamepad.event_time = now
+    overridden = overrides(udp_gamepad, gamepad, now)
+    for other in gamepads:
+        overridden = overridden or overrides(other, gamepad, now)
+    if overridden:
+        gamepad_ignored_count += size // gamepad_event_size
+        return
+
+    if gamepad is not current_gamepad:
+        select_gamepad(gamepad)
+    dispatch = gamepad.dispatch
+
+    # Current time in the clock of the kernel timestamps, split like them
+    now = time.time()
+    now_sec = int(now)
+    now_usec = int((now - now_sec) * 1000000)
+
+    for pos in range(0, size, gamepad_event_size):
+        ev_type = decode_u16(gamepad_event_buffer, pos + gamepad_type_offset)
+        code = decode_u16(gamepad_event_buffer, pos + gamepad_code_offset)
+        gamepad_event_count += 1
+
+        handler = dispatch.get((ev_type << 16) | code)
+        if handler is not None:
+            if ev_type == ev_syn and pos + gamepad_event_size < size:
+                # Age of the event frame from its kernel timestamp
+                age = ((now_sec - decode_s32(gamepad_event_buffer, pos)) * 1000 +
+                    (now_usec - decode_s32(gamepad_event_buffer, pos + gamepad_usec_offset)) // 1000)
+                if age > gamepad_stale_age:
+                    frame_stale = True
+                    continue
+            if latency_probe and ev_type == ev_syn:
+                # Kernel timestamp of the event frame
+                frame_event_time = (decode_s32(gamepad_event_buffer, pos) +
+                    decode_s32(gamepad_event_buffer, pos + gamepad_usec_offset) / 1000000)
+            handler(decode_s32(gamepad_event_buffer, pos + gamepad_value_offset))
+
+async def gamepad_task(gamepad):
+    """
+    Task reading and processing events of a gamepad until it's disconnected.
+    """
+    global input_task_time
+    reader = uasyncio.StreamReader(gamepad.infile)
+    while True:
+        # Wait until events are pending and read them with one call, the device file is
+        # non-blocking, so the read returns the pending events without waiting for a full
+        # buffer. The device never returns partial events.
+        # Reading fails after the gamepad was disconnected.
+        try:
+            size = await reader.readinto(gamepad_event_buffer)
+        except OSError:
+            size = 0
+        if size is None:
+            # No events pending after all
+            continue
+        start = utime.ticks_us()
+        if not size:
+            disconnect_gamepad(gamepad)
+            return
+        process_gamepad_events(gamepad, size)
+        input_task_time += utime.ticks_diff(utime.ticks_us(), start)
+        check_free_memory()
+
+def open_udp_control(port):
+    """
+    Opens the UDP socket for control frames.
+    The socket is a control source like a gamepad (of type Xbox),
+    the axis ranges can't be queried, the default ranges are used.
+    """
+    global udp_gamepad, udp_control_port, xbox
+    udp_control_port = port
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(socket.getaddrinfo("0.0.0.0", port)[0][-1])
+    sock.setblocking(False)
+    udp_gamepad = Gamepad(sock, None, gamepad_xbox, udp_control_priority)
+    input_poll.register(udp_gamepad.infile, uselect.POLLIN)
+    if xbox is None:
+        xbox = True
+
+def process_udp_frame(buttons):
+    """
+    Converts the axes ("udp_frame_axes") and buttons of a control frame which changed
+    since the last frame to gamepad events in the event buffer and processes them.
+    """
+    global udp_button_state
+    event_sec = event_usec = 0
+    if latency_probe:
+        # Latency is measured from the receive time
+        now = time.time()
+        event_sec = int(now)
+        event_usec = int((now - event_sec) * 1000000)
+    pos = 0
+    for index in range(len(udp_axis_codes)):
+        if udp_frame_axes[index] != udp_axis_state[index]:
+            udp_axis_state[index] = udp_frame_axes[index]
+            struct.pack_into(gamepad_event_format, gamepad_event_buffer, pos,
+                event_sec, event_usec, ev_abs, udp_axis_codes[index], udp_frame_axes[index])
+            pos += gamepad_event_size
+    changed = buttons ^ udp_button_state
+    udp_button_state = buttons
+    for index in range(len(udp_button_codes)):
+        if changed & (1 << index):
+            struct.pack_into(gamepad_event_format, gamepad_event_buffer, pos,
+                event_sec, event_usec, ev_key, udp_button_codes[index], (buttons >> index) & 1)
+            pos += gamepad_event_size
+    if pos:
+        struct.pack_into(gamepad_event_format, gamepad_event_buffer, pos,
+            event_sec, event_usec, ev_syn, 0, 0)
+        process_gamepad_events(udp_gamepad, pos + gamepad_event_size)
+
+async def udp_control_task():
+    """
+    Task receiving and processing control frames over UDP.
+    """
+    global input_task_time, udp_active, udp_sequence, udp_send_time, udp_receive_time
+    global udp_frame_count, udp_lost_count, udp_out_of_order_count, udp_invalid_count
+    global udp_jitter, udp_jitter_max
+    reader = uasyncio.StreamReader(udp_gamepad.infile)
+    while True:
+        # Wait until datagrams arrive (reading nothing) and receive them one by one.
+        # A read of the socket stream would run across datagram boundaries and merge frames.
+        await reader.readinto(udp_wait_buffer)
+        while True:
+            try:
+                # One byte more to detect longer frames
+                frame = udp_gamepad.infile.recv(udp_frame_size + 1)
+            except OSError:
+                # No more datagrams pending
+                break
+            start = utime.ticks_us()
+            if len(frame) != udp_frame_size:
+                udp_invalid_count += 1
+                continue
+            sequence = decode_s32(frame, 0)
+            send_time = decode_s32(frame, 4)
+            if udp_active:
+                if sequence - udp_sequence <= 0:
+                    udp_out_of_order_count += 1
+                    continue
+                udp_lost_count += sequence - udp_sequence - 1
+                # Difference of the transit times of this frame and the previous one,
+                # the send times wrap around at 32 bits
+                send_interval = (send_time - udp_send_time) & 0xFFFFFFFF
+                if send_interval >= 0x80000000:
+                    send_interval -= 0x100000000
+                deviation = abs(utime.ticks_diff(start, udp_receive_time) - send_interval)
+                udp_jitter += deviation - ((udp_jitter + 8) >> 4)
+                if deviation > udp_jitter_max:
+                    udp_jitter_max = deviation
+            udp_active = True
+            udp_frame_count += 1
+            udp_sequence = sequence
+            udp_send_time = send_time
+            udp_receive_time = start
+            for index in range(len(udp_axis_codes)):
+                udp_frame_axes[index] = decode_u16(frame, 8 + index * 2)
+            process_udp_frame(decode_u16(frame, 14))
+            input_task_time += utime.ticks_diff(utime.ticks_us(), start)
+            check_free_memory()
+
+def udp_timeout_task():
+    """
+    Periodic task centering the stick when control frames stop arriving.
+    Buttons keep their state, so that releasing them doesn't trigger actions.
+    """
+    global udp_active, udp_timeout_count
+    if udp_active and utime.ticks_diff(utime.ticks_us(), udp_receive_time) > udp_control_timeout * 1000:
+        udp_active = False
+        udp_timeout_count += 1
+        udp_frame_axes[0] = udp_frame_axes[1] = 32767
+        udp_frame_axes[2] = 0
+        process_udp_frame(udp_button_state)
+
+def attach_gamepad(infile, device, gamepad_type, priority):
+    """
+    Prepares processing of events from the opened gamepad device file.
+    Returns the gamepad, its task must be started by the caller.
+    """
+    global xbox
+    set_nonblocking(infile)
+    gamepad = Gamepad(infile, device, gamepad_type, priority)
+    gamepads.append(gamepad)
+    input_poll.register(infile, uselect.POLLIN)
+    xbox = gamepads[0].type == gamepad_xbox
+    return gamepad
+
+def connect_gamepads():
+    """
+    Looks for gamepads and opens device files of those which aren't connected yet.
+    Returns the list of newly connected gamepads.
+    """
+    global gamepad_scan_time
+    gamepad_scan_time = utime.ticks_ms()
+    connected_gamepads = []
+    for (device, gamepad_type, priority) in find_gamepads():
+        connected = False
+        for gamepad in gamepads:
+            connected = connected or gamepad.device == device
+        if not connected:
+            try:
+                infile = open("/dev/input/" + device, "rb", buffering=0)
+            except OSError:
+                # The device file may appear a little later than the device
+                continue
+            connected_gamepads.append(attach_gamepad(infile, device, gamepad_type, priority))
+    return connected_gamepads
+
+def disconnect_gamepad(gamepad):
+    """
+    Stops the vehicle after a gamepad was disconnected and closes its device file.
+    Task "gamepad_scan_task" looks for the gamepad until it's back.
+    """
+    global gamepad_disconnect_count, current_gamepad, xbox, frame_stale
+    gamepad_disconnect_count += 1
+    input_poll.unregister(gamepad.infile)
+    try:
+        gamepad.infile.close()
+    except OSError:
+        pass
+    gamepads.remove(gamepad)
+    current_gamepad = None
+    if gamepads:
+        xbox = gamepads[0].type == gamepad_xbox
+    frame_axes[axis_steering] = None
+    frame_axes[axis_power] = None
+    frame_axes[axis_bump] = None
+    frame_stale = False
+    drive(0, 0, None)
+    steer(0)
+    queue_sound(brick.sound.beeps, 2)
+    if not gamepads:
+        if read_from_files:
+            # The program ends when all files given on the command line end
+            program_finished.set()
+        clear_display_lines()
+        display_line(60, "Gamepad disconnected")
+        display_line(80, "Waiting for gamepad")
+
+async def gamepad_scan_task():
+    """
+    Task looking for gamepads, often while none is connected,
+    otherwise less often for additional gamepads.
+    """
+    while True:
+        await uasyncio.sleep_ms(gamepad_rescan_period)
+        if (gamepads and
+                utime.ticks_diff(utime.ticks_ms(), gamepad_scan_time) < gamepad_hotplug_period):
+            continue
+        connected_gamepads = connect_gamepads()
+        for gamepad in connected_gamepads:
+            uasyncio.create_task(gamepad_task(gamepad))
+        if connected_gamepads:
+            print_help()
+            queue_sound(brick.sound.beeps, 1)
+
+async def main():
+    """
+    Starts the tasks and waits until the program ends.
+    """
+    for task in periodic_tasks:
+        uasyncio.create_task(periodic_task(task))
+    for gamepad in gamepads:
+        uasyncio.create_task(gamepad_task(gamepad))
+    uasyncio.create_task(display_task())
+    uasyncio.create_task(gc_task())
+    if not read_from_files:
+        uasyncio.create_task(gamepad_scan_task())
+    if udp_gamepad is not None:
+        uasyncio.create_task(udp_control_task())
+    await program_finished.wait()
+
+# Start playing sounds in background.
+_thread.start_new_thread(sound_thread, ())
+
+# The program runs as cooperative tasks of module "uasyncio": a task reading events
+# of each gamepad (and one receiving control frames over UDP), the periodic tasks (gearbox control), the display task,
+# the task collecting garbage and the task looking for gamepads. The gamepad tasks wait until new data arrive in the gamepad
+# virtual device file, so events are processed as soon as they arrive, the periodic tasks
+# sleep until they are due and the CPU sleeps when idle. Sounds are played by a thread,
+# because playing a sound blocks.
+program_finished = uasyncio.Event()
+input_task_time = 0 # CPU time of the gamepad tasks in microseconds
+
+# Find the gamepads.
+# Events can also be read from files given on the command line instead,
+# for example from FIFOs fed by "gamepad-record/replay.py", with the gamepad type
+# and the priority (see "gamepad_priorities") of each file:
+#   rov3r+.py <file> [xbox|ps] [<priority>] [<file> [xbox|ps] [<priority>] ...] [--udp <port>]
+# If no gamepad is connected yet, wait for one, unless control frames are accepted over UDP.
+args = sys.argv[1:]
+if "--udp" in args:
+    index = args.index("--udp")
+    udp_control_port = int(args[index + 1])
+    del args[index:index + 2]
+read_from_files = len(args) > 0
+if udp_control_port is not None:
+    open_udp_control(udp_control_port)
+if read_from_files:
+    while args:
+        path = args.pop(0)
+        gamepad_type = gamepad_xbox
+        if args and args[0] in ("xbox", "ps"):
+            gamepad_type = gamepad_ps if args.pop(0) == "ps" else gamepad_xbox
+        priority = 0
+        if args and args[0].isdigit():
+            priority = int(args.pop(0))
+        attach_gamepad(open(path, "rb", buffering=0), None, gamepad_type, priority)
+elif udp_gamepad is not None:
+    connect_gamepads()
+elif not connect_gamepads():
+    brick.display.text("Waiting for gamepad", (0, 80))
+    while not connect_gamepads():
+        time.sleep(gamepad_rescan_period / 1000)
 
 print_help()
 
-calibrate_motors()
+if brick.buttons() or not load_calibration() or not verify_calibration():
+    calibrate_motors()
 
-# We use event polling mechanism to read from gamepad virtual device file.
-# This allows us to check if there are new data in the file before attempting
-# to read from it. As a result the "read from file"-function never blocks
-# and we can do some other work when there are no gamepad events.
-event_selector = uselect.poll()
-event_selector.register(gamepad_infile, uselect.POLLIN)
+schedule_task(gearbox_control_task, gearbox_control_period)
+schedule_task(comfort_compensation_control, comfort_control_period)
+schedule_task(flush_motor_commands, motor_command_interval)
+schedule_task(status_line_task, status_refresh_period)
+if telemetry_enabled:
+    schedule_task(telemetry_task, telemetry_period)
+if udp_gamepad is not None:
+    schedule_task(udp_timeout_task, udp_control_timeout // 5)
 
-while True:
-    events = event_selector.poll(0)
-    if (len(events) > 0 and events[0][1] & uselect.POLLIN):
-        process_gamepad_event(gamepad_infile)
-    else:
-        # This code is executed when there are no gamepad events to proceed.
-        # Here we can check sensors or do some other work.
-        if gearbox_mode != gearbox_manual:
-            automatic_gearbox_control()
-        time.sleep(0.010) # sleep a little to reduce CPU load and power consumption
+gc.collect()
+gc.disable()
+start_time = utime.ticks_us()
+try:
+    uasyncio.run(main())
+finally:
+    park_motors()
+    report_latency()
+    dump_telemetry()
+    update_display(True)
+    report_tasks(utime.ticks_diff(utime.ticks_us(), start_time))
+    report_gc()
+    print("Gamepad events:", gamepad_event_count, ", merged:", gamepad_merged_count,
+        ", stale:", gamepad_stale_count, ", frames:", gamepad_frame_count, ", disconnects:", gamepad_disconnect_count,
+        ", ignored:", gamepad_ignored_count)
+    print("Motor commands:", first_motor.issued + second_motor.issued +
+        steering_motor.issued + gearbox_motor.issued, ", suppressed:", first_motor.suppressed +
+        second_motor.suppressed + steering_motor.suppressed + gearbox_motor.suppressed)
+    print("Display lines drawn:", display_line_count, ", clears:", display_clear_count,
+        ", postponed:", display_postponed_count)
+    print("Sound requests dropped:", sound_dropped_count)
+    if udp_gamepad is not None:
+        print("UDP frames:", udp_frame_count, ", lost:", udp_lost_count,
+            ", out of order:", udp_out_of_order_count, ", invalid:", udp_invalid_count,
+            ", timeouts:", udp_timeout_count, ", jitter:", udp_jitter >> 4,
+            "us, max:", udp_jitter_max, "us")
 
-gamepad_infile.close() # will never executed actually, due to endless while loop
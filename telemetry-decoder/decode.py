@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+#  This file is part of hugbug ev3 repository. See <https://github.com/hugbug/ev3>.
+#
+#  This is a program to convert telemetry recorded by Rov3r+ to CSV.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import struct
+import sys
+
+# Usage: decode.py <telemetry file> [CSV file]
+# The CSV is written to the standard output if no CSV file is given.
+
+# Format of the telemetry file, see "dump_telemetry" in "rov3r+.py".
+# The file consists of blocks, one per dump. Each block has a header followed by
+# the fields of all samples (32-bit little-endian integers, as written by the EV3 brick).
+telemetry_magic = b"RTLM"
+telemetry_header_format = '<4sBHI'
+telemetry_header_size = struct.calcsize(telemetry_header_format)
+
+# Field names. Fields power_bump and power_compensation are fixed-point numbers
+# with 10 fractional bits.
+telemetry_fields = ("time_ms", "gear", "power_pos", "steering_pos", "speed", "power_bump", "power_compensation")
+telemetry_fixed_point = (5, 6)
+fixed_one = 1 << 10
+
+def decode(telemetry_path, out_file):
+    """
+    Writes the samples of the telemetry file as CSV lines to the output file.
+    Returns the number of samples.
+    """
+    count = 0
+    with open(telemetry_path, "rb") as in_file:
+        header_written = False
+        dump = 0
+        header = in_file.read(telemetry_header_size)
+        while len(header) == telemetry_header_size:
+            (magic, fields, period, samples) = struct.unpack(telemetry_header_format, header)
+            if magic != telemetry_magic or fields != len(telemetry_fields):
+                raise ValueError("Not a telemetry file: " + telemetry_path)
+            if not header_written:
+                out_file.write(",".join(("dump",) + telemetry_fields) + "\n")
+                header_written = True
+            values = struct.unpack("<%di" % (samples * fields), in_file.read(samples * fields * 4))
+            for sample in range(samples):
+                out_file.write("%d" % dump)
+                for field in range(fields):
+                    value = values[sample * fields + field]
+                    if field in telemetry_fixed_point:
+                        out_file.write(",%.4g" % (value / fixed_one))
+                    else:
+                        out_file.write(",%d" % value)
+                out_file.write("\n")
+            count += samples
+            dump += 1
+            header = in_file.read(telemetry_header_size)
+    return count
+
+if len(sys.argv) < 2:
+    print("Usage: decode.py <telemetry file> [CSV file]")
+    sys.exit(1)
+
+if len(sys.argv) > 2:
+    with open(sys.argv[2], "w") as csv_file:
+        count = decode(sys.argv[1], csv_file)
+    print("Decoded", count, "samples")
+else:
+    decode(sys.argv[1], sys.stdout)
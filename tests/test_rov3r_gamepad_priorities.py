@@ -0,0 +1,98 @@
+#  This file is part of hugbug ev3 repository. See <https://github.com/hugbug/ev3>.
+#
+#  Tests of the gamepad priorities of rov3r+: an instructor can take over from a driver
+#  using the same type of gamepad. Runs rov3r+ on a desktop computer with "ev3-sim",
+#  the gamepads are FIFOs fed by the test.
+#
+#    python3 -m unittest discover tests
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import re
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+repository = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+program_path = os.path.join(repository, "rov3r+", "rov3r+.py")
+
+# Time for the program to start (calibrate the motors) before the gamepads send events.
+start_time = 2.0
+
+def frame(throttle):
+    """
+    Returns an event frame of an Xbox gamepad moving the left stick vertically:
+    axis event and SYN_REPORT.
+    """
+    now = time.time()
+    sec = int(now)
+    usec = int((now - sec) * 1000000)
+    return (struct.pack('llHHi', sec, usec, 3, 1, throttle) +
+        struct.pack('llHHi', sec, usec, 0, 0, 0))
+
+class GamepadPrioritiesTest(unittest.TestCase):
+
+    def run_program(self, driver_priority, instructor_priority):
+        """
+        Runs rov3r+ with two Xbox gamepads, the driver and the instructor.
+        The driver pushes the stick, the instructor takes over and the driver pushes
+        the stick again 0.1 seconds later.
+        Returns the number of gamepad events ignored by the program.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            driver_path = os.path.join(directory, "driver")
+            instructor_path = os.path.join(directory, "instructor")
+            os.mkfifo(driver_path)
+            os.mkfifo(instructor_path)
+            environment = dict(os.environ, PYTHONPATH=os.path.join(repository, "ev3-sim"))
+            program = subprocess.Popen([sys.executable, program_path,
+                driver_path, "xbox", str(driver_priority), instructor_path, "xbox", str(instructor_priority)],
+                cwd=directory, env=environment, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            try:
+                # The program opens the FIFOs in this order
+                with open(driver_path, "wb", buffering=0) as driver:
+                    with open(instructor_path, "wb", buffering=0) as instructor:
+                        time.sleep(start_time)
+                        driver.write(frame(0))
+                        time.sleep(0.3)
+                        instructor.write(frame(65535))
+                        time.sleep(0.1)
+                        driver.write(frame(0))
+                        time.sleep(0.3)
+                (output, errors) = program.communicate(timeout=30)
+            finally:
+                if program.poll() is None:
+                    program.kill()
+                    program.wait()
+        output = output.decode()
+        self.assertEqual(program.returncode, 0, output)
+        return int(re.search(r"ignored: (\d+)", output).group(1))
+
+    def test_instructor_takes_over(self):
+        # The second frame of the driver comes while the instructor is in use
+        self.assertEqual(self.run_program(0, 1), 2)
+
+    def test_same_priority(self):
+        self.assertEqual(self.run_program(0, 0), 0)
+
+    def test_driver_keeps_control_over_lower_priority(self):
+        # The instructor's frame comes while the driver with the higher priority is in use
+        self.assertEqual(self.run_program(1, 0), 2)
+
+if __name__ == "__main__":
+    unittest.main()
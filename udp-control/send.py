@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+#  This file is part of hugbug ev3 repository. See <https://github.com/hugbug/ev3>.
+#
+#  This is a program to send control frames over UDP to Rov3r+ for testing the network
+#  control channel. The left stick sweeps forward and back while steering slowly left and right.
+#
+#  This program is free software; you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation; either version 2 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import math
+import random
+import socket
+import struct
+import sys
+import time
+
+# Usage: send.py [host] [port] [--rate <frames per second>] [--duration <seconds>]
+#   [--loss <probability>] [--reorder <probability>]
+# Options "--loss" and "--reorder" drop frames or swap them with the next frame,
+# to test the handling of lost and late frames.
+
+# Format of a control frame, see "udp_frame_format" in "rov3r+.py":
+# sequence number, send time in microseconds, left stick x and y, right trigger, buttons.
+udp_frame_format = '<IIHHHH'
+
+def send(host, port, rate, duration, loss, reorder):
+    """
+    Sends control frames to the host. Returns the number of sent frames.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    random.seed(1)
+    count = 0
+    held = None # frame waiting to be sent after the next one
+    start_time = time.time()
+    sequence = 0
+    while True:
+        elapsed = time.time() - start_time
+        if elapsed >= duration:
+            break
+        sequence += 1
+        stick_x = int(32767 + 20000 * math.sin(elapsed * 2 * math.pi / 6))
+        stick_y = int(32767 - 30000 * math.sin(elapsed * 2 * math.pi / 4))
+        frame = struct.pack(udp_frame_format, sequence, int(time.time() * 1000000) & 0xFFFFFFFF,
+            stick_x, stick_y, 0, 0)
+        if random.random() < loss:
+            pass
+        elif held is None and random.random() < reorder:
+            held = frame
+        else:
+            sock.sendto(frame, (host, port))
+            count += 1
+            if held is not None:
+                sock.sendto(held, (host, port))
+                count += 1
+                held = None
+        time.sleep(max(0, start_time + sequence / rate - time.time()))
+    # Center the stick at the end
+    sequence += 1
+    sock.sendto(struct.pack(udp_frame_format, sequence, int(time.time() * 1000000) & 0xFFFFFFFF,
+        32767, 32767, 0, 0), (host, port))
+    return count + 1
+
+# Command line: positional arguments and options with their values
+args = []
+options = {"--rate": 50, "--duration": 10, "--loss": 0, "--reorder": 0}
+argv = sys.argv[1:]
+while argv:
+    arg = argv.pop(0)
+    if arg in options and argv:
+        options[arg] = float(argv.pop(0))
+    elif arg.startswith("--"):
+        print("Usage: send.py [host] [port] [--rate <frames per second>] [--duration <seconds>] "
+            "[--loss <probability>] [--reorder <probability>]")
+        sys.exit(1)
+    else:
+        args.append(arg)
+host = args[0] if len(args) > 0 else "127.0.0.1"
+port = int(args[1]) if len(args) > 1 else 5005
+
+count = send(host, port, options["--rate"], options["--duration"], options["--loss"], options["--reorder"])
+print("Sent", count, "frames")
@@ -3,76 +3,135 @@
 from pybricks.tools import print
  
 import struct
+import uselect
  
+def set_nonblocking(device_file):
+    """
+    Switches the opened device file to non-blocking mode. On MicroPython a blocking read
+    waits until the whole buffer is filled, a non-blocking read returns the pending events
+    at once (None if there are none)
+    """
+    try:
+        import os
+        os.set_blocking(device_file.fileno(), False)
+    except (ImportError, AttributeError):
+        # MicroPython has no "os.set_blocking", call fcntl from the C library directly
+        import ffi
+        fcntl = ffi.open("libc.so.6").func("i", "fcntl", "iii")
+        flags = fcntl(device_file.fileno(), 3, 0) # F_GETFL
+        fcntl(device_file.fileno(), 4, flags | 0x800) # F_SETFL, O_NONBLOCK
+
+def decode_u16(buffer, pos):
+    """
+    Decodes unsigned short (little-endian) at the given position of the buffer
+    """
+    return buffer[pos] | (buffer[pos + 1] << 8)
+
+def decode_s32(buffer, pos):
+    """
+    Decodes signed 32-bit integer (little-endian) at the given position of the buffer
+    """
+    value = buffer[pos] | (buffer[pos + 1] << 8) | (buffer[pos + 2] << 16)
+    if buffer[pos + 3] & 0x80:
+        return value + ((buffer[pos + 3] - 256) << 24)
+    return value + (buffer[pos + 3] << 24)
+
 # Find the Xbox Controller:
 # /dev/input/event2 is the usual file handler for the gamepad.
 # look at contents of /proc/bus/input/devices if it doesn't work.
 infile_path = "/dev/input/event2"
  
-# open file in binary mode
-in_file = open(infile_path, "rb")
+# open file in binary mode, unbuffered and non-blocking so that reads return
+# the pending events without waiting for more
+in_file = open(infile_path, "rb", buffering=0)
+set_nonblocking(in_file)
+event_poll = uselect.poll()
+event_poll.register(in_file, uselect.POLLIN)
+
+def read_events():
+    """
+    Waits for events and reads the pending ones into the event buffer.
+    Returns number of bytes read, 0 at the end of the file
+    """
+    while True:
+        event_poll.poll()
+        size = in_file.readinto(event_buffer)
+        if size is not None:
+            return size
  
 # Read from the file
-# long int, long int, unsigned short, unsigned short, long int
-FORMAT = 'llHHl'
+# long int, long int, unsigned short, unsigned short, int
+# (the value is a 32-bit int, the same as long int on the EV3 brick)
+FORMAT = 'llHHi'
 EVENT_SIZE = struct.calcsize(FORMAT)
-event = in_file.read(EVENT_SIZE)
+
+# Events are read in batches into a preallocated buffer and decoded in place,
+# so no memory is allocated per event
+EVENT_BATCH = 16
+TYPE_OFFSET = struct.calcsize('ll')
+CODE_OFFSET = TYPE_OFFSET + 2
+VALUE_OFFSET = TYPE_OFFSET + 4
+event_buffer = bytearray(EVENT_SIZE * EVENT_BATCH)
+size = read_events()
 
 num = 0
 
-while event:
-    (tv_sec, tv_usec, ev_type, code, value) = struct.unpack(FORMAT, event)
+while size:
+    for pos in range(0, size, EVENT_SIZE):
+        ev_type = decode_u16(event_buffer, pos + TYPE_OFFSET)
+        code = decode_u16(event_buffer, pos + CODE_OFFSET)
+        value = decode_s32(event_buffer, pos + VALUE_OFFSET)
 
-    if ev_type == 1 or ev_type == 3:
-        num = num + 1
-        button = ""
+        if ev_type == 1 or ev_type == 3:
+            num = num + 1
+            button = ""
 
-        if ev_type == 1:
-            if code == 304:
-                button = "A"
-            elif code == 305:
-                button = "B"
-            elif code == 307:
-                button = "X"
-            elif code == 308:
-                button = "Y"
-            elif code == 310:
-                button = "LB"
-            elif code == 311:
-                button = "RB"
-            elif code == 158:
-                button = "BACK"
-            elif code == 315:
-                button = "MENU"
-            elif code == 317:
-                button = "LEFT STICK"
-            elif code == 318:
-                button = "RIGHT STICK"
+            if ev_type == 1:
+                if code == 304:
+                    button = "A"
+                elif code == 305:
+                    button = "B"
+                elif code == 307:
+                    button = "X"
+                elif code == 308:
+                    button = "Y"
+                elif code == 310:
+                    button = "LB"
+                elif code == 311:
+                    button = "RB"
+                elif code == 158:
+                    button = "BACK"
+                elif code == 315:
+                    button = "MENU"
+                elif code == 317:
+                    button = "LEFT STICK"
+                elif code == 318:
+                    button = "RIGHT STICK"
 
-        elif ev_type == 3:
-            if code == 0:
-                button = "LEFT STICK X"
-            elif code == 1:
-                button = "LEFT STICK Y"
-            elif code == 2:
-                button = "RIGHT STICK X"
-            elif code == 5:
-                button = "RIGHT STICK Y"
-            elif code == 9:
-                button = "RT"
-            elif code == 10:
-                button = "LT"
-            elif code == 16:
-                button = "D-PAD X"
-            elif code == 17:
-                button = "D-PAD Y"
+            elif ev_type == 3:
+                if code == 0:
+                    button = "LEFT STICK X"
+                elif code == 1:
+                    button = "LEFT STICK Y"
+                elif code == 2:
+                    button = "RIGHT STICK X"
+                elif code == 5:
+                    button = "RIGHT STICK Y"
+                elif code == 9:
+                    button = "RT"
+                elif code == 10:
+                    button = "LT"
+                elif code == 16:
+                    button = "D-PAD X"
+                elif code == 17:
+                    button = "D-PAD Y"
 
-        message = "[%d] RAW: %d %d %d" % (num, ev_type, code, value)
-        if button != "":
-            message = message + (", DECODED: %s %s" % (button, value))
-        print(message)
+            message = "[%d] RAW: %d %d %d" % (num, ev_type, code, value)
+            if button != "":
+                message = message + (", DECODED: %s %s" % (button, value))
+            print(message)
 
-    # Finally, read another event
-    event = in_file.read(EVENT_SIZE)
+    # Finally, read more events
+    size = read_events()
  
 in_file.close()
\ No newline at end of file
@@ -1,9 +1,20 @@
 #!/usr/bin/env pybricks-micropython
  
 from pybricks.ev3devices import (Motor)
-from pybricks.parameters import (Port)
+from pybricks.parameters import (Port, Stop)
  
+import gc
 import struct
+import sys
+import time
+import uselect
+import utime
+from array import array
+
+# Modules shared by the programs of this repository are in directory "common"
+# next to the program directory, or copied to the program directory.
+sys.path.append(__file__[:__file__.rfind("/") + 1] + "../common")
+from motor_control import CachedMotor, Mixer
 
 # Adjustements for middle position in a case your stick isn't ideally centered
 left_stick_middle_x = 0
@@ -12,9 +23,20 @@ left_stick_middle_y = 0
 # Minimum required movement of the stick from center position to start motors
 left_stick_deadzone = 15
 
+# Minimum change of motor power (in percent) sent to the motors
+motor_dc_epsilon = 1
+
 # Declare motors 
-left_motor = Motor(Port.B)
-right_motor = Motor(Port.C)
+left_motor = CachedMotor(Motor(Port.B), motor_dc_epsilon)
+right_motor = CachedMotor(Motor(Port.C), motor_dc_epsilon)
+
+# Differential drive mixer, see class "Mixer". The trim (percent of the power of the motor,
+# lower it for the faster motor if the vehicle pulls to one side) and the response curve
+# (0 is linear, up to 100 gives finer control at low powers) are applied by lookup tables.
+left_motor_trim = 100
+right_motor_trim = 100
+motor_curve = 0
+mixer = Mixer(left_motor, right_motor, left_motor_trim, right_motor_trim, motor_curve)
 
 # Initialize variables. 
 # Assuming sticks are in the middle when starting.
@@ -36,45 +58,363 @@ def scale(val, src, dst):
     return (float(val - src[0]) / (src[1] - src[0])) * (dst[1] - dst[0]) + dst[0]
 
 
-# Find the Xbox Controller :
-# /dev/input/event2 is the usual file handler for the gamepad.
-# look at contents of /proc/bus/input/devices if it doesn't work.
-infile_path = "/dev/input/event2"
+# A helper function for building lookup tables from function "scale",
+# so stick values are converted with a single table lookup.
+def build_scale_table(src, dst):
+    """
+    Build lookup table for scaling integer values from the scale of src to the scale of dst.
+    Sources with more than 256 values are quantized to 256 table entries.
+
+    src: tuple of int
+    dst: tuple
+
+    Returns the table and the bit shift to apply to (val - src[0]) before the lookup.
+    """
+    shift = 0
+    while ((src[1] - src[0]) >> shift) > 255:
+        shift += 1
+    table = array('h', bytes(2 * (((src[1] - src[0]) >> shift) + 1)))
+    for index in range(len(table)):
+        # Use the middle of the quantization step as representative value
+        val = src[0] + (index << shift) + ((1 << shift) >> 1)
+        table[index] = round(scale(min(val, src[1]), src, dst))
+    return (table, shift)
+
+def find_controller():
+    """
+    Check device list by reading content of virtual file "/proc/bus/input/devices"
+    looking for gamepad device (Xbox or PlayStation).
+    """
+    with open("/proc/bus/input/devices", "r") as fp:
+        found = False
+        line = fp.readline()
+        while line:
+            if line.startswith("N: Name=") and (line.find("Xbox") > -1 or
+                    line.find("PLAYSTATION") > -1 and line.find("Motion") == -1):
+                found = True
+            if found and line.startswith("H: Handlers="):
+                line = line[len("H: Handlers="):]
+                pb = line.find("event")
+                pe = line.find(" ", pb)
+                return line[pb:pe]
+            line = fp.readline()
+    return None
+
+def read_axis_range(device_file, axis, default):
+    """
+    Query range of a gamepad axis via ioctl EVIOCGABS.
+    Returns tuple (minimum, maximum, fuzz, flat) or the default if the gamepad can't be queried.
+    """
+    # struct input_absinfo: value, minimum, maximum, fuzz, flat, resolution
+    absinfo = bytearray(24)
+    request = 0x80184540 + axis # EVIOCGABS(axis)
+    try:
+        try:
+            import fcntl
+            fcntl.ioctl(device_file.fileno(), request, absinfo)
+        except ImportError:
+            # MicroPython has no module "fcntl", call ioctl from the C library directly
+            import ffi
+            ioctl = ffi.open("libc.so.6").func("i", "ioctl", "iLp")
+            if ioctl(device_file.fileno(), request, absinfo) != 0:
+                return default
+    except (ImportError, OSError):
+        return default
+    (value, minimum, maximum, fuzz, flat, resolution) = struct.unpack('6i', absinfo)
+    if maximum <= minimum:
+        return default
+    return (minimum, maximum, fuzz, flat)
+
+def set_nonblocking(device_file):
+    """
+    Switches the opened device file to non-blocking mode. On MicroPython a blocking read
+    waits until the whole buffer is filled, a non-blocking read returns the pending events
+    at once (None if there are none).
+    """
+    try:
+        import os
+        os.set_blocking(device_file.fileno(), False)
+    except (ImportError, AttributeError):
+        # MicroPython has no "os.set_blocking", call fcntl from the C library directly
+        import ffi
+        fcntl = ffi.open("libc.so.6").func("i", "fcntl", "iii")
+        flags = fcntl(device_file.fileno(), 3, 0) # F_GETFL
+        fcntl(device_file.fileno(), 4, flags | 0x800) # F_SETFL, O_NONBLOCK
+
+def decode_u16(buffer, pos):
+    """
+    Decodes unsigned short (little-endian) at the given position of the buffer
+    """
+    return buffer[pos] | (buffer[pos + 1] << 8)
+
+def decode_s32(buffer, pos):
+    """
+    Decodes signed 32-bit integer (little-endian) at the given position of the buffer
+    """
+    value = buffer[pos] | (buffer[pos + 1] << 8) | (buffer[pos + 2] << 16)
+    if buffer[pos + 3] & 0x80:
+        return value + ((buffer[pos + 3] - 256) << 24)
+    return value + (buffer[pos + 3] << 24)
+
+# Period (in seconds) of looking for the gamepad while it isn't connected
+gamepad_rescan_period = 0.2
+
+def connect_controller():
+    """
+    Look for the gamepad and open its device file.
+    Returns the opened file or None if the gamepad isn't connected.
+    """
+    global gamepad_device
+    device = find_controller()
+    if device is None:
+        return None
+    try:
+        device_file = open("/dev/input/" + device, "rb", buffering=0)
+    except OSError:
+        # The device file may appear a little later than the device
+        return None
+    gamepad_device = device
+    return device_file
+
+def wait_for_controller():
+    """
+    Look for the gamepad until it's connected, returns its opened device file.
+    Scanning the device list allocates memory, it's collected while waiting,
+    as automatic garbage collection is disabled.
+    """
+    device_file = connect_controller()
+    while device_file is None:
+        time.sleep(gamepad_rescan_period)
+        gc.collect()
+        device_file = connect_controller()
+    return device_file
 
-# open file in binary mode
-in_file = open(infile_path, "rb")
+# Find the gamepad:
+# The contents of /proc/bus/input/devices lists all devices.
+# Events can also be read from a file given on the command line instead,
+# for example from a FIFO fed by "gamepad-record/replay.py".
+# If the gamepad isn't connected yet, wait for it.
+gamepad_device = None
+if len(sys.argv) > 1:
+    in_file = open(sys.argv[1], "rb", buffering=0)
+else:
+    in_file = wait_for_controller()
+
+# The file is opened in binary mode and unbuffered, switch it to non-blocking mode
+# so that reads return the pending events without waiting for more
+set_nonblocking(in_file)
+
+# Query stick ranges (used if the gamepad can't be queried: 0..65535)
+(stick_x_min, stick_x_max, fuzz, stick_x_flat) = read_axis_range(in_file, 0, (0, 65535, 0, 0))
+(stick_y_min, stick_y_max, fuzz, stick_y_flat) = read_axis_range(in_file, 1, (0, 65535, 0, 0))
+
+# Increase deadzone if the flat zone of the gamepad is larger
+left_stick_deadzone = max(left_stick_deadzone,
+    stick_x_flat * 200 // (stick_x_max - stick_x_min), stick_y_flat * 200 // (stick_y_max - stick_y_min))
+
+# Lookup tables for scaling stick positions to -100,100
+(stick_x_table, stick_x_shift) = build_scale_table((stick_x_min, stick_x_max), (100, -100))
+(stick_y_table, stick_y_shift) = build_scale_table((stick_y_min, stick_y_max), (100, -100))
+
+# Sticks are in the middle when starting
+left_stick_x = (stick_x_min + stick_x_max) // 2
+left_stick_y = (stick_y_min + stick_y_max) // 2
 
 # Read from the file
-# long int, long int, unsigned short, unsigned short, long int
-FORMAT = 'llHHl'
+# long int, long int, unsigned short, unsigned short, int
+# (the value is a 32-bit int, the same as long int on the EV3 brick)
+FORMAT = 'llHHi'
 EVENT_SIZE = struct.calcsize(FORMAT)
-event = in_file.read(EVENT_SIZE)
 
-while event:
-    (tv_sec, tv_usec, ev_type, code, value) = struct.unpack(FORMAT, event)
+# Events are read in batches into a preallocated buffer and decoded in place,
+# so no memory is allocated per event
+EVENT_BATCH = 16
+TYPE_OFFSET = struct.calcsize('ll')
+CODE_OFFSET = TYPE_OFFSET + 2
+VALUE_OFFSET = TYPE_OFFSET + 4
+event_buffer = bytearray(EVENT_SIZE * EVENT_BATCH)
+
+# Input watchdog: if no gamepad events arrive for "input_watchdog_timeout" milliseconds
+# while the motors are driving, the motors are stopped with "input_watchdog_stop"
+# (Stop.COAST or Stop.BRAKE) and the stick is centered. A lost gamepad (read error,
+# device gone) stops the motors without the watchdog, see "read_events".
+# The gamepad sends no events while the stick is held still, so the watchdog also stops
+# the vehicle when the stick is held steady for longer than the timeout. Therefore it's
+# disabled (None) by default. If enabled, the timeout must be longer than the stick
+# is ever held still, for example 5000.
+input_watchdog_timeout = None
+input_watchdog_stop = Stop.COAST
+input_watchdog_count = 0 # number of times the watchdog stopped the motors
+input_watchdog_max_detection = 0 # longest time (ms) from the last events to stopping the motors
+last_event_time = utime.ticks_ms()
+driving = False # True while the stick is outside of the deadzone
 
-    if ev_type == 3 and code == 0:
-        left_stick_x = value
-    elif ev_type == 3 and code == 1:
-        left_stick_y = value
+# Waiting for events with a timeout, so the watchdog runs while the gamepad is silent
+event_poll = uselect.poll()
+event_poll.register(in_file, uselect.POLLIN)
 
-    # Scale stick positions to -100,100
-    forward = scale(left_stick_y, (0,65535), (100,-100))
-    left = scale(left_stick_x, (0,65535), (100,-100))
+# Garbage collection: automatic collections are disabled, so that a collection never
+# pauses processing of gamepad events. The memory is collected in idle gaps instead:
+# no events are pending and the input watchdog isn't due before the collection ends
+# (judging by the average collection so far). It collects at most every "gc_idle_period"
+# milliseconds and only after at least "gc_idle_allocated" bytes were allocated since
+# the last collection. If free memory drops below "gc_min_free" bytes while events keep
+# coming, the memory is collected right away after processing the events.
+gc_idle_period = 200
+gc_idle_allocated = 4096
+gc_min_free = 16384
+gc_idle_count = 0 # number of collections in idle gaps
+gc_forced_count = 0 # number of collections because of low free memory
+gc_pause_total = 0 # time spent collecting in microseconds
+gc_pause_max = 0 # longest collection in microseconds
+gc_last_time = utime.ticks_ms() # time of the last collection
+gc_last_alloc = 0 # allocated memory after the last collection
+# Desktop Python has no "gc.mem_free" and "gc.mem_alloc", there the memory
+# is collected in idle gaps only and without looking at the allocated memory.
+gc_can_measure = hasattr(gc, "mem_free")
+
+def input_watchdog():
+    """
+    Stops the motors and centers the stick after no events arrived for the watchdog timeout.
+    """
+    global left_stick_x, left_stick_y, driving, input_watchdog_count, input_watchdog_max_detection
+    detection = utime.ticks_diff(utime.ticks_ms(), last_event_time)
+    left_motor.stop(input_watchdog_stop)
+    right_motor.stop(input_watchdog_stop)
+    left_stick_x = (stick_x_min + stick_x_max) // 2
+    left_stick_y = (stick_y_min + stick_y_max) // 2
+    driving = False
+    input_watchdog_count += 1
+    input_watchdog_max_detection = max(input_watchdog_max_detection, detection)
+    print("No gamepad events for", detection, "ms, motors stopped")
+
+def collect_garbage(forced):
+    """
+    Collects garbage and records the length of the pause.
+    """
+    global gc_idle_count, gc_forced_count, gc_pause_total, gc_pause_max, gc_last_time, gc_last_alloc
+    start = utime.ticks_us()
+    gc.collect()
+    pause = utime.ticks_diff(utime.ticks_us(), start)
+    gc_pause_total += pause
+    if pause > gc_pause_max:
+        gc_pause_max = pause
+    if forced:
+        gc_forced_count += 1
+    else:
+        gc_idle_count += 1
+    gc_last_time = utime.ticks_ms()
+    if gc_can_measure:
+        gc_last_alloc = gc.mem_alloc()
+
+def collect_garbage_when_idle(time_left):
+    """
+    Collects garbage while no events are pending, see "gc_idle_period".
+    "time_left" is the time (ms) until the input watchdog is due, None if it isn't active.
+    """
+    if (utime.ticks_diff(utime.ticks_ms(), gc_last_time) < gc_idle_period or
+            gc_can_measure and gc.mem_alloc() - gc_last_alloc < gc_idle_allocated or
+            event_poll.poll(0)):
+        return
+    pause = gc_pause_total // max(gc_idle_count + gc_forced_count, 1)
+    if time_left is None or time_left * 1000 > pause:
+        collect_garbage(False)
+
+def check_free_memory():
+    """
+    Collects garbage right away if free memory is low.
+    """
+    if gc_can_measure and gc.mem_free() < gc_min_free:
+        collect_garbage(True)
+
+def read_events():
+    """
+    Reads pending events into the event buffer. If the gamepad was disconnected
+    stops the motors and waits until the gamepad is back. While the motors are driving
+    waits for events at most until the deadline of the input watchdog.
+    Returns number of bytes read, 0 at the end of the file given on the command line.
+    """
+    global in_file, left_stick_x, left_stick_y, driving, last_event_time
+    check_free_memory()
+    while True:
+        time_left = None
+        if input_watchdog_timeout is not None and driving:
+            time_left = input_watchdog_timeout - utime.ticks_diff(utime.ticks_ms(), last_event_time)
+        collect_garbage_when_idle(time_left)
+        # The device file is non-blocking, wait until events are pending
+        timeout = -1
+        if time_left is not None:
+            timeout = max(input_watchdog_timeout - utime.ticks_diff(utime.ticks_ms(), last_event_time), 0)
+        if not event_poll.poll(timeout):
+            input_watchdog()
+            continue
+        try:
+            size = in_file.readinto(event_buffer)
+        except OSError:
+            # Reading fails after the gamepad was disconnected
+            size = 0
+        if size is None:
+            # No events pending after all
+            continue
+        if size:
+            last_event_time = utime.ticks_ms()
+        if size or gamepad_device is None:
+            return size
 
-    # Check stick deadzone
-    if (-left_stick_deadzone < forward and forward < left_stick_deadzone and
-            -left_stick_deadzone < left and left < left_stick_deadzone):
         left_motor.dc(0)
         right_motor.dc(0)
-    else:
-        # Set motor voltages. If we're steering left, the left motor
-        # must run backwards so it has a -left component
-        # It has a forward component for going forward too. 
-        left_motor.dc(forward - left)
-        right_motor.dc(forward + left)
+        left_stick_x = (stick_x_min + stick_x_max) // 2
+        left_stick_y = (stick_y_min + stick_y_max) // 2
+        driving = False
+        event_poll.unregister(in_file)
+        try:
+            in_file.close()
+        except OSError:
+            pass
+        in_file = wait_for_controller()
+        set_nonblocking(in_file)
+        event_poll.register(in_file, uselect.POLLIN)
+
+gc.collect()
+gc.disable()
+size = read_events()
+
+while size:
+    for pos in range(0, size, EVENT_SIZE):
+        ev_type = decode_u16(event_buffer, pos + TYPE_OFFSET)
+        code = decode_u16(event_buffer, pos + CODE_OFFSET)
+        value = decode_s32(event_buffer, pos + VALUE_OFFSET)
+
+        if ev_type == 3 and code == 0:
+            left_stick_x = value
+        elif ev_type == 3 and code == 1:
+            left_stick_y = value
+
+        # Scale stick positions to -100,100
+        forward = stick_y_table[(left_stick_y - stick_y_min) >> stick_y_shift]
+        left = stick_x_table[(left_stick_x - stick_x_min) >> stick_x_shift]
+
+        # Check stick deadzone
+        if (-left_stick_deadzone < forward and forward < left_stick_deadzone and
+                -left_stick_deadzone < left and left < left_stick_deadzone):
+            left_motor.dc(0)
+            right_motor.dc(0)
+            driving = False
+        else:
+            driving = True
+            # Set motor voltages. If we're steering left, the left motor
+            # must run backwards so it has a -left component
+            # It has a forward component for going forward too. 
+            mixer.mix(forward, left)
+
+    # Finally, read more events
+    size = read_events()
 
-    # Finally, read another event
-    event = in_file.read(EVENT_SIZE)
+in_file.close()
 
-in_file.close()
\ No newline at end of file
+print("Motor commands:", left_motor.issued + right_motor.issued,
+    ", suppressed:", left_motor.suppressed + right_motor.suppressed)
+print("Input watchdog: fired", input_watchdog_count, "times, worst detection time:",
+    input_watchdog_max_detection, "ms")
+print("Garbage collections: idle:", gc_idle_count, ", forced:", gc_forced_count,
+    ", pause avg:", gc_pause_total // max(gc_idle_count + gc_forced_count, 1), "us, max:", gc_pause_max, "us")